@@ -0,0 +1,189 @@
+"""本地替身: 代替 stream_gears 的上传与登录接口，用于基准测试。
+
+不连接 B 站，按配置模拟每个请求的延迟、上行带宽与失败概率；上传时默认真实
+读取文件内容，使磁盘读取也计入耗时。install() 后 `import stream_gears`
+得到的就是本模块，up.py / ts.py / login.py 的代码无需任何改动。
+
+line_bandwidth_mbps 为各条线路设置不同的带宽，serve_lines() 为每条线路启动一个
+按同样带宽接收数据的本地 HTTP 节点，作为 line_probe.targets 供线路探测使用。
+
+    import fake_stream_gears
+    fake_stream_gears.install(latency=0.05, bandwidth_mbps=20, error_rate=0.1)
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import json
+import random
+import sys
+import threading
+import time
+
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 投稿失败时服务器返回的示例错误
+ERROR_RESPONSE = {'code': 21070, 'message': '稿件投递过于频繁，请稍后再试'}
+
+_options = {
+    'latency': 0.0,         # 每个请求（预上传、每个分段、提交）的往返秒数
+    'bandwidth_mbps': 0.0,  # 全进程共享的上行带宽 (MB/s)，0 表示不限
+    'line_bandwidth_mbps': {},  # 各线路的带宽，覆盖 bandwidth_mbps（每条线路单独排队）
+    'error_rate': 0.0,      # 每次 upload_by_app 失败的概率
+    'error_mode': 'code',   # code: 返回错误码 | raise: 抛出异常
+    'read_files': True,     # 是否真实读取分段内容
+    'login_polls': 2,       # 扫码登录在第几次轮询时成功
+    'seed': None,
+}
+_lock = threading.Lock()
+_state = {'aid': 0, 'polls': 0, 'busy_until': {}}
+calls = []
+
+
+class UploadLine:
+    Bda2 = 'Bda2'
+    Ws = 'Ws'
+    Qn = 'Qn'
+    Bda = 'Bda'
+    Tx = 'Tx'
+    Txa = 'Txa'
+    Bldsa = 'Bldsa'
+    Alia = 'Alia'
+
+
+def configure(**options):
+    unknown = set(options) - set(_options)
+    if unknown:
+        raise TypeError(f'未知选项: {", ".join(sorted(unknown))}')
+    _options.update(options)
+    if options.get('seed') is not None:
+        random.seed(options['seed'])
+
+
+def install(**options):
+    """把本模块注册为 stream_gears，并应用选项"""
+    configure(**options)
+    calls.clear()
+    sys.modules['stream_gears'] = sys.modules[__name__]
+    return sys.modules[__name__]
+
+
+def _bandwidth(line):
+    return float(_options['line_bandwidth_mbps'].get(line, _options['bandwidth_mbps']))
+
+
+def _transfer(size, line=None):
+    """按线路的带宽排队，返回本次传输应当结束的时刻（monotonic）"""
+    bandwidth = _bandwidth(line)
+    if bandwidth <= 0:
+        return time.monotonic()
+    with _lock:
+        busy = _state['busy_until']
+        start = max(time.monotonic(), busy.get(line, 0.0))
+        busy[line] = start + size / 1024 / 1024 / bandwidth
+        return busy[line]
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        while f.read(READ_CHUNK_SIZE):
+            pass
+
+
+def _sleep_until(deadline):
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+def upload_by_app(video_path, cookie_file, title, tid=171, tag='', copyright=2, source='', desc='',
+                  dynamic='', cover='', dolby=0, lossless_music=0, no_reprint=0, open_elec=0,
+                  up_close_reply=False, up_selection_reply=False, up_close_danmu=False, limit=3,
+                  desc_v2=None, dtime=None, line=None, extra_fields='', proxy=None):
+    started = time.monotonic()
+    latency = float(_options['latency'])
+    total_bytes = 0
+    time.sleep(latency)
+    for path in video_path:
+        size = Path(path).stat().st_size
+        total_bytes += size
+        deadline = _transfer(size, line) + latency
+        if _options['read_files']:
+            _read(path)
+        _sleep_until(deadline)
+    time.sleep(latency)
+
+    failed = random.random() < float(_options['error_rate'])
+    with _lock:
+        _state['aid'] += 1
+        aid = _state['aid']
+        calls.append({'title': title, 'parts': len(video_path), 'bytes': total_bytes, 'limit': limit,
+                      'line': line, 'seconds': time.monotonic() - started, 'ok': not failed})
+    if failed:
+        if _options['error_mode'] == 'raise':
+            raise RuntimeError('模拟的上传错误: 连接被重置')
+        return json.dumps(ERROR_RESPONSE, ensure_ascii=False)
+    return json.dumps({'code': 0, 'message': '0', 'data': {'aid': aid, 'bvid': f'BV1{aid:09d}'}})
+
+
+def get_qrcode(proxy=None):
+    time.sleep(float(_options['latency']))
+    with _lock:
+        _state['polls'] = 0
+    return json.dumps({'code': 0, 'data': {'url': 'https://passport.bilibili.com/h5-app/passport/login/scan?qrcode_key=bench',
+                                           'auth_code': 'bench'}})
+
+
+def login_by_qrcode(ret, proxy=None):
+    """与真实接口一样，成功时把凭据写入当前目录的 cookies.json"""
+    time.sleep(float(_options['latency']))
+    with _lock:
+        _state['polls'] += 1
+        if _state['polls'] < int(_options['login_polls']):
+            raise RuntimeError('二维码尚未确认')
+    expires = int(time.time()) + 180 * 86400
+    with open('cookies.json', 'w', encoding='utf-8') as f:
+        json.dump({'cookie_info': {'cookies': [{'name': 'SESSDATA', 'value': 'bench', 'expires': expires}]},
+                   'token_info': {'expires_in': 180 * 86400}}, f)
+    return True
+
+
+def login_by_cookies(file, proxy=None):
+    time.sleep(float(_options['latency']))
+    return Path(file).exists()
+
+
+class _ProbeHandler(BaseHTTPRequestHandler):
+    """按所属线路的带宽读取请求体，模拟上传节点"""
+
+    def do_PUT(self):
+        remaining = int(self.headers.get('Content-Length') or 0)
+        bandwidth = _bandwidth(self.server.line)
+        started = time.monotonic()
+        received = 0
+        while remaining > 0:
+            data = self.rfile.read(min(65536, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            received += len(data)
+            if bandwidth > 0:
+                _sleep_until(started + received / 1024 / 1024 / bandwidth)
+        self.send_response(403)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_POST = do_PUT
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_lines(lines):
+    """为每条线路启动一个本地节点，返回 {线路: URL}；节点在后台线程中运行直到进程退出"""
+    targets = {}
+    for line in lines:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _ProbeHandler)
+        server.daemon_threads = True
+        server.line = line
+        threading.Thread(target=server.serve_forever, name=f'probe-{line}', daemon=True).start()
+        targets[line] = f'http://127.0.0.1:{server.server_address[1]}/'
+    return targets
@@ -0,0 +1,85 @@
+"""入口脚本冷启动耗时基准。
+
+在全新的解释器中用 `python -X importtime` 导入 up / ts / log，汇总总耗时，
+并列出累计耗时最多的模块，用来发现又被放回模块顶层的重量级依赖。
+
+用法:
+    python bench/importtime.py                 # 每个入口跑 5 次，取中位数
+    python bench/importtime.py -n 10 --top 15 up ts
+    python bench/importtime.py --json          # 输出 JSON，便于记录历次结果
+"""
+from pathlib import Path
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MODULES = ['up', 'ts', 'log']
+# 这些依赖应当只在真正用到时才导入，出现在入口的导入链中时给出提示
+HEAVY_MODULES = ['stream_gears', 'PIL', 'psutil', 'numpy']
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 的输出，返回 [(模块名, 自身微秒, 累计微秒, 缩进层级)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        # 格式: "import time:  self | cumulative |   <缩进>模块名"，模块名前每两个空格为一层
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(module, runs):
+    """在新解释器中导入 module runs 次，返回 (墙钟耗时列表, 最后一次的导入明细)"""
+    wall, rows = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              cwd=REPO_DIR, capture_output=True, text=True)
+        wall.append(time.perf_counter() - started)
+        if proc.returncode != 0:
+            raise RuntimeError(f'import {module} 失败:\n{proc.stderr[-2000:]}')
+        rows = parse_importtime(proc.stderr)
+    return wall, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='入口脚本冷启动耗时基准')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES, help='要测量的入口模块')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='每个模块的测量次数')
+    parser.add_argument('--top', type=int, default=10, help='列出累计耗时最多的模块数')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    args = parser.parse_args()
+
+    report = {}
+    for module in args.modules:
+        wall, rows = measure(module, args.runs)
+        own = next((r for r in rows if r[0] == module), None)
+        top_level = sorted((r for r in rows if r[3] <= 1 and r[0] != module), key=lambda r: -r[2])
+        loaded = {r[0].split('.')[0] for r in rows}
+        report[module] = {
+            'wall_ms': round(statistics.median(wall) * 1000, 1),
+            'import_ms': round(own[2] / 1000, 1) if own else None,
+            'top': [{'module': r[0], 'cumulative_ms': round(r[2] / 1000, 1)} for r in top_level[:args.top]],
+            'heavy_loaded': [m for m in HEAVY_MODULES if m in loaded],
+        }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    for module, result in report.items():
+        print(f'== {module}: 进程总耗时 {result["wall_ms"]} ms (中位数), 导入 {result["import_ms"]} ms')
+        for item in result['top']:
+            print(f'   {item["cumulative_ms"]:>8.1f} ms  {item["module"]}')
+        if result['heavy_loaded']:
+            print(f'   启动时已加载重量级依赖: {", ".join(result["heavy_loaded"])}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""上传流程端到端基准。
+
+在临时目录中生成合成的 TS 录制目录与配置，用本地替身 (fake_stream_gears)
+代替 stream_gears，然后分别测量:
+  - up.main:  完整上传流程的总耗时，以及 metrics.jsonl 中记录的各阶段耗时
+  - ts.main:  检查标题并在进程内调用上传流程的总耗时
+  - log.py:   首页、分页、tail、搜索、/metrics 与 /trends 的响应时间
+每次运行前清空日志簿、去重索引与目录快照，各次结果可直接比较。
+
+用法:
+    python bench/pipeline.py                               # 默认: 1 场 x 20 段 x 2 MB，各跑 3 次
+    python bench/pipeline.py --parts 2000 --part-mb 0.5    # 大量小分段
+    python bench/pipeline.py --latency 0.05 --bandwidth 50 --error-rate 0.2
+    python bench/pipeline.py --line-bandwidth Ws=50,Qn=10,Bda2=5  # 各线路带宽不同，测试线路探测
+    python bench/pipeline.py --save base.json              # 保存结果
+    python bench/pipeline.py --baseline base.json          # 与之前的结果比较，变慢超过阈值时退出码为 1
+"""
+from collections import Counter
+from pathlib import Path
+import argparse
+import json
+import logging
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import fake_stream_gears
+import tsgen
+
+import yaml
+
+# 每次运行前删除的状态文件
+STATE_FILES = ['upload_journal.jsonl', 'dedup_index.jsonl', 'scan_index.json', 'upload_tuning.json',
+               'line_probe.json']
+LOG_ENDPOINTS = [
+    ('index', '/'),
+    ('page', '/?file=upload.log&page=1'),
+    ('tail', '/?file=upload.log&tail=100'),
+    ('search', '/search?q=BV1'),
+    ('metrics', '/metrics'),
+    ('trends', '/trends'),
+]
+# 与基准结果比较时，变慢超过该比例视为退化
+DEFAULT_THRESHOLD = 0.2
+# 会话结束后连接预算没有全部归还的记录 [(会话名, 可用连接数, 连接上限)]
+budget_leaks = []
+
+
+def parse_line_bandwidth(text):
+    """解析 "Ws=50,Qn=10" 为 {'Ws': 50.0, 'Qn': 10.0}"""
+    result = {}
+    for item in filter(None, (text or '').split(',')):
+        line, _, mbps = item.partition('=')
+        result[line.strip()] = float(mbps)
+    return result
+
+
+def write_config(work_dir, args, line_targets=None):
+    """生成基准用的 config.yaml，所有状态文件都放在 work_dir 中"""
+    config = {
+        'paths': {
+            'video_folder': str(work_dir / 'rec'),
+            'cookies_file': str(work_dir / 'cookies.json'),
+            'log_file': str(work_dir / 'upload.log'),
+            'log_file1': str(work_dir / 'upload1.log'),
+            'journal_file': str(work_dir / 'upload_journal.jsonl'),
+            'dedup_file': str(work_dir / 'dedup_index.jsonl'),
+            'tuning_file': str(work_dir / 'upload_tuning.json'),
+            'scan_snapshot': str(work_dir / 'scan_index.json'),
+            'metrics_file': str(work_dir / 'metrics.jsonl'),
+            'line_probe_file': str(work_dir / 'line_probe.json'),
+            'name': args.title,
+        },
+        'behavior': {'delete_after_upload': False},
+        'upload': {'max_retries': args.max_retries, 'retry_backoff': 0},
+        'validate': {'active_seconds': 0},
+    }
+    if line_targets:
+        # 本地节点读完整个请求体后才返回 403，因此 403 表示数据已收到
+        config['line_probe'] = {'enabled': True, 'targets': line_targets, 'lines': list(line_targets),
+                                'burst_kb': args.probe_kb, 'expect_status': [403]}
+    with open(work_dir / 'config.yaml', 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    (work_dir / 'cookies.json').write_text('{}', encoding='utf-8')
+
+
+def reset_state(work_dir):
+    for name in STATE_FILES:
+        (work_dir / name).unlink(missing_ok=True)
+
+
+def last_run_stages(work_dir):
+    """读取 metrics.jsonl 最后一次运行的各阶段耗时 (ms)"""
+    try:
+        with open(work_dir / 'metrics.jsonl', 'r', encoding='utf-8') as f:
+            run = json.loads(f.readlines()[-1])
+    except (OSError, IndexError, ValueError):
+        return {}
+    return {stage: sum(values) * 1000 for stage, values in run.get('stages', {}).items()}
+
+
+def check_budget_release(up_module):
+    """包装 up.upload_session: 每个会话结束后若没有其他会话在上传，连接预算应已全部归还"""
+    original = up_module.upload_session
+    if getattr(original, 'checks_budget', False):
+        return
+    lock = threading.Lock()
+    active = Counter()
+
+    def upload_session(session, config, script_dir, cookie_file, journal, budget, *args, **kwargs):
+        with lock:
+            active[id(budget)] += 1
+        try:
+            return original(session, config, script_dir, cookie_file, journal, budget, *args, **kwargs)
+        finally:
+            with lock:
+                active[id(budget)] -= 1
+                if not active[id(budget)] and budget.available != budget.max_connections:
+                    budget_leaks.append((session['name'], budget.available, budget.max_connections))
+
+    upload_session.checks_budget = True
+    up_module.upload_session = upload_session
+
+
+def bench_entry(module, work_dir, runs):
+    """调用 module.main() runs 次，返回总耗时与各阶段耗时的中位数"""
+    module.get_script_dir = lambda: work_dir
+    wall, stages, exit_codes = [], [], []
+    fake_stream_gears.calls.clear()
+    budget_leaks.clear()
+    for _ in range(runs):
+        reset_state(work_dir)
+        started = time.perf_counter()
+        try:
+            exit_codes.append(module.main() or 0)
+        except SystemExit as e:
+            exit_codes.append(e.code)
+        wall.append((time.perf_counter() - started) * 1000)
+        stages.append(last_run_stages(work_dir))
+    uploads = list(fake_stream_gears.calls)
+    stage_names = sorted({s for run in stages for s in run})
+    return {
+        'wall_ms': round(statistics.median(wall), 1),
+        'stages_ms': {s: round(statistics.median(run.get(s, 0) for run in stages), 1) for s in stage_names},
+        'exit_codes': exit_codes,
+        'uploads': len(uploads),
+        'failed_uploads': sum(1 for c in uploads if not c['ok']),
+        'lines': dict(Counter(c['line'] or '默认' for c in uploads)),
+        'budget_leaks': list(budget_leaks),
+    }
+
+
+def bench_log(work_dir, requests):
+    """用 Flask 测试客户端请求 log.py 的各个页面，返回每个页面的中位数与 p95 (ms)"""
+    import log
+    log.base_dir = str(work_dir)
+    client = log.app.test_client()
+    report = {}
+    for name, url in LOG_ENDPOINTS:
+        samples = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            samples.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} 返回 {response.status_code}')
+        samples.sort()
+        report[name] = {
+            'median_ms': round(statistics.median(samples), 2),
+            'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        }
+    return report
+
+
+def append_log_lines(path, count):
+    """在上传日志末尾追加 count 行合成日志，用于测量大日志下的页面响应"""
+    if count <= 0:
+        return
+    line = '2025-01-01 00:00:00,000 - INFO - 合成日志 {0}: 开始上传 Bench_2025-01-01_{0:03d}.ts, BVID BV1{0:09d}\n'
+    with open(path, 'a', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(line.format(i))
+
+
+def compare(report, baseline, threshold):
+    """返回比基准慢超过 threshold 的指标列表 [(名称, 基准值, 当前值)]"""
+    regressions = []
+
+    def check(name, old, new):
+        if old and new > old * (1 + threshold):
+            regressions.append((name, old, new))
+
+    for entry in ('up.main', 'ts.main'):
+        if entry in report and entry in baseline:
+            check(f'{entry} 总耗时', baseline[entry]['wall_ms'], report[entry]['wall_ms'])
+            for stage, value in report[entry]['stages_ms'].items():
+                check(f'{entry} {stage}', baseline[entry]['stages_ms'].get(stage), value)
+    for name, result in report.get('log', {}).items():
+        if name in baseline.get('log', {}):
+            check(f'log {name}', baseline['log'][name]['median_ms'], result['median_ms'])
+    return regressions
+
+
+def print_report(report):
+    params = report['params']
+    print(f'数据集: {params["sessions"]} 场 x {params["parts"]} 段 x {params["part_mb"]} MB; '
+          f'模拟延迟 {params["latency"]} s, 带宽 {params["bandwidth"] or "不限"} MB/s, 失败率 {params["error_rate"]}')
+    for entry in ('up.main', 'ts.main'):
+        if entry not in report:
+            continue
+        result = report[entry]
+        print(f'== {entry}: {result["wall_ms"]} ms (中位数), 退出码 {result["exit_codes"]}, '
+              f'上传调用 {result["uploads"]} 次, 失败 {result["failed_uploads"]} 次, 线路 {result["lines"]}')
+        for stage, value in result['stages_ms'].items():
+            print(f'   {value:>10.1f} ms  {stage}')
+        for name, available, total in result.get('budget_leaks', []):
+            print(f'   连接预算未归还: 会话 {name} 结束后可用 {available}/{total}')
+    if 'log' in report:
+        print('== log.py')
+        for name, result in report['log'].items():
+            print(f'   {result["median_ms"]:>8.2f} ms  (p95 {result["p95_ms"]:.2f})  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上传流程端到端基准（使用本地 stream_gears 替身）')
+    parser.add_argument('--sessions', type=int, default=1, help='合成的直播场次')
+    parser.add_argument('--parts', type=int, default=20, help='每场的分段数')
+    parser.add_argument('--part-mb', type=float, default=2.0, help='每个分段的大小 (MB)')
+    parser.add_argument('--title', default='Bench', help='文件名中的标题')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟的每个请求往返秒数')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='模拟的上行带宽 MB/s，0 为不限')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='每次上传调用失败的概率')
+    parser.add_argument('--line-bandwidth', help='各线路的带宽 MB/s，如 Ws=50,Qn=10；设置后启用线路探测')
+    parser.add_argument('--probe-kb', type=int, default=256, help='线路探测的突发上传大小 (KB)')
+    parser.add_argument('--max-retries', type=int, default=3, help='upload.max_retries')
+    parser.add_argument('-n', '--runs', type=int, default=3, help='up.main 与 ts.main 各运行的次数')
+    parser.add_argument('--requests', type=int, default=50, help='每个 log.py 页面的请求次数')
+    parser.add_argument('--log-lines', type=int, default=0, help='额外追加到上传日志的合成行数')
+    parser.add_argument('--only', choices=['up', 'ts', 'log'], action='append', help='只运行指定部分，可重复')
+    parser.add_argument('--workdir', help='工作目录（默认临时目录，结束后删除）')
+    parser.add_argument('--seed', type=int, default=1, help='失败注入的随机种子')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--save', help='把结果保存为 JSON 文件')
+    parser.add_argument('--baseline', help='与该 JSON 结果比较')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='判定为变慢的比例')
+    args = parser.parse_args()
+    parts = set(args.only or ['up', 'ts', 'log'])
+
+    line_bandwidth = parse_line_bandwidth(args.line_bandwidth)
+    fake_stream_gears.install(latency=args.latency, bandwidth_mbps=args.bandwidth, line_bandwidth_mbps=line_bandwidth,
+                              error_rate=args.error_rate, seed=args.seed)
+    line_targets = fake_stream_gears.serve_lines(line_bandwidth) if line_bandwidth else None
+    work_dir = Path(args.workdir or tempfile.mkdtemp(prefix='upbench-')).resolve()
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # 日志只写入文件，不在控制台输出，避免终端输出拖慢测量
+    logging.basicConfig(level=logging.INFO, handlers=[logging.FileHandler(work_dir / 'bench.log', encoding='utf-8')],
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    report = {'params': {'sessions': args.sessions, 'parts': args.parts, 'part_mb': args.part_mb,
+                         'latency': args.latency, 'bandwidth': args.bandwidth, 'error_rate': args.error_rate}}
+    try:
+        write_config(work_dir, args, line_targets)
+        started = time.perf_counter()
+        tsgen.generate(work_dir / 'rec', args.sessions, args.parts, args.part_mb, args.title)
+        report['params']['generate_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+        import up
+        check_budget_release(up)
+        if 'up' in parts:
+            report['up.main'] = bench_entry(up, work_dir, args.runs)
+        if 'ts' in parts:
+            import ts
+            up.get_script_dir = lambda: work_dir
+            report['ts.main'] = bench_entry(ts, work_dir, args.runs)
+        if 'log' in parts:
+            append_log_lines(work_dir / 'upload.log', args.log_lines)
+            report['log'] = bench_log(work_dir, args.requests)
+    finally:
+        logging.shutdown()
+        if not args.workdir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    leaked = [entry for entry in ('up.main', 'ts.main') if report.get(entry, {}).get('budget_leaks')]
+    if leaked:
+        print(f'连接预算泄漏: {", ".join(leaked)}')
+        sys.exit(1)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for name, old, new in regressions:
+            print(f'变慢: {name} {old:.1f} -> {new:.1f} ms ({(new / old - 1) * 100:+.0f}%)')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
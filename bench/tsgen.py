@@ -0,0 +1,88 @@
+"""生成合成的 TS 录制目录，用于基准测试。
+
+每个分段都是合法的 MPEG-TS（同步字节与连续计数器正确），能通过 tscheck 的
+完整性检查；首尾两个包带有各自的标记，内容指纹互不相同，不会被去重跳过。
+文件名按录制软件的格式 `标题_日期_序号.ts` 生成，每个会话一天。
+
+用法:
+    python bench/tsgen.py out/rec --sessions 2 --parts 50 --part-mb 8
+    python bench/tsgen.py out/rec --parts 3000 --part-mb 1 --title Jiaozi
+"""
+from datetime import date, timedelta
+from pathlib import Path
+import argparse
+import os
+import time
+
+TS_PACKET_SIZE = 188
+PID = 0x100
+# 每次写入的包数，取 16 的倍数使每块都从连续计数器 0 开始
+CHUNK_PACKETS = 16 * 350
+MIN_PACKETS = 16
+
+
+def _packet(cc, marker=b''):
+    header = bytes([0x47, (PID >> 8) & 0x1F, PID & 0xFF, 0x10 | (cc & 0x0F)])
+    payload = marker[:TS_PACKET_SIZE - 4]
+    return header + payload + b'\xff' * (TS_PACKET_SIZE - 4 - len(payload))
+
+
+_CHUNK = b''.join(_packet(i % 16) for i in range(CHUNK_PACKETS))
+
+
+def write_segment(path, size_bytes, marker):
+    """写入一个约 size_bytes 字节的 TS 分段，返回实际大小"""
+    packets = max(MIN_PACKETS, size_bytes // TS_PACKET_SIZE)
+    tag = marker.encode('utf-8')
+    with open(path, 'wb') as f:
+        written = 0
+        while written < packets:
+            count = min(CHUNK_PACKETS, packets - written)
+            chunk = _CHUNK[:count * TS_PACKET_SIZE]
+            if written == 0:
+                chunk = _packet(0, b'head:' + tag) + chunk[TS_PACKET_SIZE:]
+            f.write(chunk)
+            written += count
+        f.seek((packets - 1) * TS_PACKET_SIZE)
+        f.write(_packet((packets - 1) % 16, b'tail:' + tag))
+    return packets * TS_PACKET_SIZE
+
+
+def generate(folder, sessions=1, parts=10, part_mb=1.0, title='Bench', start_date=None, age_seconds=600):
+    """在 folder 中生成 sessions 个会话、每个 parts 个分段，返回生成的文件列表。
+
+    文件修改时间设为 age_seconds 秒之前，模拟已经录完的分段（不会被当作仍在写入）。
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    start_date = start_date or date(2025, 1, 1)
+    size_bytes = int(part_mb * 1024 * 1024)
+    mtime = time.time() - age_seconds
+    paths = []
+    for s in range(sessions):
+        day = (start_date + timedelta(days=s)).isoformat()
+        for p in range(parts):
+            path = folder / f'{title}_{day}_{p:03d}.ts'
+            write_segment(path, size_bytes, path.name)
+            os.utime(path, (mtime, mtime))
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成的 TS 录制目录')
+    parser.add_argument('folder', help='输出目录')
+    parser.add_argument('--sessions', type=int, default=1, help='会话（直播场次）数，每场一天')
+    parser.add_argument('--parts', type=int, default=10, help='每个会话的分段数')
+    parser.add_argument('--part-mb', type=float, default=1.0, help='每个分段的大小 (MB)')
+    parser.add_argument('--title', default='Bench', help='文件名中的标题')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    paths = generate(args.folder, args.sessions, args.parts, args.part_mb, args.title)
+    total_mb = sum(p.stat().st_size for p in paths) / 1024 / 1024
+    print(f'已生成 {len(paths)} 个分段，共 {total_mb:.1f} MB，用时 {time.perf_counter() - started:.1f} 秒')
+
+
+if __name__ == '__main__':
+    main()
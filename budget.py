@@ -0,0 +1,175 @@
+from datetime import datetime
+from pathlib import Path
+import logging
+import os
+import threading
+import time
+
+# 判断"正在录制"的依据：录制目录中有视频文件在该秒数内被写入
+DEFAULT_LIVE_ACTIVE_SECONDS = 60
+# 估算的单连接上传速率，用于把带宽上限换算为允许的连接数
+DEFAULT_PER_CONNECTION_MBPS = 8
+DEFAULT_REPORT_INTERVAL = 60
+VIDEO_SUFFIXES = ('.ts', '.mp4', '.flv')
+
+
+class ConnectionBudget:
+    """进程内所有上传共享的并发连接上限。
+
+    每个投稿在调用 upload_by_app 前按其 limit 申请连接数，用完归还；
+    额度不足时阻塞等待，保证同时上传的会话总连接数不超过上限。
+    上限可以在运行中调整（见 BandwidthScheduler），已占用的连接不受影响，
+    新的申请按新上限计算。
+    """
+
+    def __init__(self, max_connections):
+        self.max_connections = max(1, int(max_connections))
+        self.available = self.max_connections
+        self._cond = threading.Condition()
+
+    def acquire(self, count):
+        """申请 count 个连接（超过上限时按上限计），返回实际获得的数量"""
+        count = max(1, int(count))
+        with self._cond:
+            # 等待期间上限可能被调整，因此每次都按当前上限截断
+            self._cond.wait_for(lambda: self.available >= min(count, self.max_connections))
+            granted = min(count, self.max_connections)
+            self.available -= granted
+        return granted
+
+    def release(self, count):
+        with self._cond:
+            self.available += count
+            self._cond.notify_all()
+
+    def set_max(self, max_connections):
+        """调整连接上限；调低时 available 可能暂时为负，直到占用的连接归还"""
+        max_connections = max(1, int(max_connections))
+        with self._cond:
+            self.available += max_connections - self.max_connections
+            self.max_connections = max_connections
+            self._cond.notify_all()
+
+
+def _parse_hhmm(value):
+    h, m = str(value).split(':')
+    return int(h) * 60 + int(m)
+
+
+def is_recording(video_folder, active_seconds=DEFAULT_LIVE_ACTIVE_SECONDS):
+    """录制目录中是否有视频文件正在被写入"""
+    now = time.time()
+    try:
+        with os.scandir(video_folder) as it:
+            for entry in it:
+                if (entry.is_file() and entry.name.lower().endswith(VIDEO_SUFFIXES)
+                        and now - entry.stat().st_mtime < active_seconds):
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+class BandwidthScheduler:
+    """按时间窗口与录制状态限制上传占用的带宽，避免挤占录制软件的网络。
+
+    规则按顺序匹配，第一条命中的生效，例如:
+        bandwidth:
+          rules:
+            - when: live          # 录制进行中
+              max_mbps: 20
+            - start: "01:00"      # 夜间不限速
+              end: "08:00"
+              max_mbps: 0
+            - max_mbps: 50        # 其余时间
+    max_mbps 为 0 或未命中任何规则时不限速。
+
+    stream_gears 的上传在原生代码中进行，无法在 Python 侧逐字节限速，
+    因此带宽上限通过共享的 ConnectionBudget 换算为允许的并发连接数，
+    并根据实测的本机发送速率做闭环修正：超出预算就减少连接，
+    明显低于预算则逐步放开。每个周期在日志中报告实际速率与预算。
+    一次 upload_by_app 调用的并发数在开始时确定，无法中途调整，因此新上限只对之后开始的
+    上传与重试生效，正在进行的上传仍按原连接数传完。
+    """
+
+    def __init__(self, budget, bandwidth_cfg, video_folder):
+        self.budget = budget
+        self.base_max = budget.max_connections
+        self.rules = bandwidth_cfg.get('rules') or []
+        # 多主播常驻模式下传入所有录制目录，任一目录在录制都算录制中
+        folders = video_folder if isinstance(video_folder, (list, tuple)) else [video_folder]
+        self.video_folders = [Path(f) for f in folders]
+        self.interval = float(bandwidth_cfg.get('report_interval', DEFAULT_REPORT_INTERVAL))
+        self.per_connection_mbps = float(bandwidth_cfg.get('per_connection_mbps', DEFAULT_PER_CONNECTION_MBPS))
+        self.live_active_seconds = float(bandwidth_cfg.get('live_active_seconds', DEFAULT_LIVE_ACTIVE_SECONDS))
+        self.allowed = self.base_max
+        self.current_rule = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def match_rule(self, now=None):
+        now = now or datetime.now()
+        minute = now.hour * 60 + now.minute
+        live = None
+        for rule in self.rules:
+            if rule.get('when') == 'live':
+                if live is None:
+                    live = any(is_recording(f, self.live_active_seconds) for f in self.video_folders)
+                if not live:
+                    continue
+            if 'start' in rule and 'end' in rule:
+                start, end = _parse_hhmm(rule['start']), _parse_hhmm(rule['end'])
+                in_window = start <= minute < end if start <= end else (minute >= start or minute < end)
+                if not in_window:
+                    continue
+            return rule
+        return None
+
+    def start(self):
+        if not self.rules:
+            return
+        self._apply(self.match_rule())
+        self._thread = threading.Thread(target=self._run, name='bandwidth', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.budget.set_max(self.base_max)
+
+    def _apply(self, rule):
+        cap = float(rule.get('max_mbps', 0)) if rule else 0
+        if rule is not self.current_rule:
+            self.current_rule = rule
+            if cap > 0:
+                self.allowed = max(1, min(self.base_max, int(cap // self.per_connection_mbps)))
+                logging.info(f"[带宽] 生效规则 {rule}: 预算 {cap:.0f} Mbit/s，"
+                             f"之后开始的上传与重试最多使用 {self.allowed} 个连接（进行中的上传不受影响）")
+            else:
+                self.allowed = self.base_max
+                logging.info(f"[带宽] 当前不限速，之后开始的上传与重试最多使用 {self.allowed} 个连接")
+            self.budget.set_max(self.allowed)
+        return cap
+
+    def _run(self):
+        import psutil
+        last_sent, last_time = psutil.net_io_counters().bytes_sent, time.monotonic()
+        while not self._stop.wait(self.interval):
+            sent, now = psutil.net_io_counters().bytes_sent, time.monotonic()
+            actual = (sent - last_sent) * 8 / 1e6 / max(now - last_time, 1e-6)
+            last_sent, last_time = sent, now
+
+            cap = self._apply(self.match_rule())
+            if cap > 0:
+                # 本机总发送速率包含其他程序的流量，按实测值微调连接数
+                if actual > cap * 1.1 and self.allowed > 1:
+                    self.allowed -= 1
+                    self.budget.set_max(self.allowed)
+                elif actual < cap * 0.7 and self.allowed < self.base_max:
+                    self.allowed += 1
+                    self.budget.set_max(self.allowed)
+                logging.info(f"[带宽] 实际上传 {actual:.1f} Mbit/s / 预算 {cap:.0f} Mbit/s，"
+                             f"之后开始的上传与重试最多使用 {self.allowed} 个连接")
+            else:
+                logging.info(f"[带宽] 实际上传 {actual:.1f} Mbit/s (不限速)")
@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+
+# 快速指纹读取的头尾字节数
+SAMPLE_BYTES = 1024 * 1024
+# 完整哈希时每个并行块的大小
+FULL_HASH_CHUNK = 64 * 1024 * 1024
+DIGEST_SIZE = 16
+DEFAULT_HASH_WORKERS = 4
+# filter_duplicates 返回的重复类型: 与已上传的投稿重复 / 与同一批次中的文件重复
+DUPLICATE_UPLOADED = 'uploaded'
+DUPLICATE_IN_BATCH = 'in_batch'
+
+
+def partial_fingerprint(path):
+    """快速指纹: 文件大小 + 头部 1 MB + 尾部 1 MB 的 BLAKE2b，只读取约 2 MB"""
+    path = Path(path)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        h = hashlib.blake2b(size.to_bytes(8, 'little'), digest_size=DIGEST_SIZE)
+        h.update(f.read(SAMPLE_BYTES))
+        if size > SAMPLE_BYTES:
+            f.seek(max(SAMPLE_BYTES, size - SAMPLE_BYTES))
+            h.update(f.read(SAMPLE_BYTES))
+    return h.hexdigest()
+
+
+def full_fingerprint(path, workers=DEFAULT_HASH_WORKERS):
+    """完整指纹: 内存映射文件，按 64 MB 分块在线程池中并行计算 BLAKE2b，再对块摘要做一次哈希。
+
+    hashlib 计算大块数据时会释放 GIL，因此多线程可以真正并行。
+    """
+    path = Path(path)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        root = hashlib.blake2b(size.to_bytes(8, 'little'), digest_size=DIGEST_SIZE)
+        if size == 0:
+            return root.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            view = memoryview(buf)
+            try:
+                def hash_chunk(offset):
+                    return hashlib.blake2b(view[offset:offset + FULL_HASH_CHUNK], digest_size=DIGEST_SIZE).digest()
+
+                with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                    for digest in pool.map(hash_chunk, range(0, size, FULL_HASH_CHUNK)):
+                        root.update(digest)
+            finally:
+                view.release()
+    return root.hexdigest()
+
+
+class DedupIndex:
+    """已上传内容的指纹索引（append-only JSON Lines），防止同一份录像被重复投稿。
+
+    以快速指纹为键常驻内存，查询为 O(1)。快速指纹只用来找候选，判定重复一律以完整哈希为准:
+    登记时同时保存完整哈希；旧记录没有完整哈希时，原文件仍在原位置才对两者做完整哈希，
+    原文件已删除则无法确认，不算重复（重复文件可能被删除，宁可多传一份）。
+    """
+
+    def __init__(self, index_path, hash_workers=DEFAULT_HASH_WORKERS):
+        self.path = Path(index_path)
+        self.hash_workers = hash_workers
+        self.entries = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry['partial'], []).append(entry)
+                    except (ValueError, KeyError):
+                        continue
+
+    def fingerprint(self, path):
+        """返回文件的快速指纹（同一次运行中缓存）"""
+        path = Path(path)
+        st = path.stat()
+        cache_key = (str(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._fingerprints.get(cache_key)
+        if cached is None:
+            cached = partial_fingerprint(path)
+            with self._lock:
+                self._fingerprints[cache_key] = cached
+        return cached
+
+    def _full(self, path):
+        return full_fingerprint(path, self.hash_workers)
+
+    def lookup(self, path, partial=None):
+        """若该文件的内容已上传过，返回对应的历史记录，否则返回 None"""
+        partial = partial or self.fingerprint(path)
+        candidates = self.entries.get(partial)
+        if not candidates:
+            return None
+        full = None
+        for entry in candidates:
+            expected = entry.get('full')
+            if not expected:
+                original = Path(entry['path'])
+                if not original.exists():
+                    continue
+                expected = self._full(original)
+            full = full or self._full(path)
+            if expected == full:
+                return entry
+        return None
+
+    def record(self, paths, bvid=None):
+        """投稿成功后登记这些文件的指纹"""
+        lines = []
+        for path in paths:
+            path = Path(path)
+            try:
+                partial = self.fingerprint(path)
+                full = self._full(path)
+            except OSError as e:
+                logging.warning(f"无法登记文件指纹 {path.name}: {e}")
+                continue
+            entry = {'partial': partial, 'full': full, 'path': str(path), 'name': path.name,
+                     'size': path.stat().st_size, 'bvid': bvid, 'ts': time.time()}
+            lines.append(entry)
+        if not lines:
+            return
+        # 后台清理线程登记时，主线程可能正在查找
+        with self._lock:
+            for entry in lines:
+                self.entries.setdefault(entry['partial'], []).append(entry)
+            lines = [json.dumps(entry, ensure_ascii=False) for entry in lines]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def filter_duplicates(self, video_paths):
+        """剔除重复内容，返回 (待上传文件, [(重复文件, 重复类型, 原因)])
+
+        重复类型为 DUPLICATE_UPLOADED 或 DUPLICATE_IN_BATCH，原因只用于日志。
+        """
+        with ThreadPoolExecutor(max_workers=max(1, self.hash_workers)) as pool:
+            partials = list(pool.map(self.fingerprint, video_paths))
+
+        unique, duplicates = [], []
+        seen = {}
+        for path, partial in zip(video_paths, partials):
+            entry = self.lookup(path, partial)
+            if entry is not None:
+                duplicates.append((path, DUPLICATE_UPLOADED, f"与已上传的 {entry['name']} 内容相同 (BVID: {entry.get('bvid')})"))
+                continue
+            # 同一批次中的重复（例如录制软件把同一分段复制了两份）
+            twin = seen.get(partial)
+            if twin is not None and self._full(twin) == self._full(path):
+                duplicates.append((path, DUPLICATE_IN_BATCH, f"与本批次中的 {twin.name} 内容相同"))
+                continue
+            seen.setdefault(partial, path)
+            unique.append(path)
+        return unique, duplicates
@@ -0,0 +1,151 @@
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+# 会话状态
+PENDING = 'pending'        # 已登记，尚未开始上传
+UPLOADING = 'uploading'    # 正在上传（进程中断后重启时仍停留在此状态）
+FAILED = 'failed'          # 最近一次尝试失败，等待重试
+SUBMITTED = 'submitted'    # 投稿成功，已拿到 BVID
+CLEANED = 'cleaned'        # 投稿成功且本地文件已清理
+
+UNFINISHED_STATES = (PENDING, UPLOADING, FAILED)
+DONE_STATES = (SUBMITTED, CLEANED)
+
+
+def part_key(path):
+    """分段文件在日志簿中的标识：文件名 + 字节数"""
+    path = Path(path)
+    return f"{path.name}:{path.stat().st_size}"
+
+
+class UploadJournal:
+    """上传日志簿（append-only JSON Lines）。
+
+    每次状态变化追加一行并 fsync，进程崩溃最多丢失正在写入的最后一行。
+    启动时回放全部事件重建每个投稿会话及其分段的状态，用于：
+      - 跳过已经投稿成功的分段，不再重复上传
+      - 继续上次中断或失败的投稿（沿用会话与累计重试次数）
+    """
+
+    def __init__(self, journal_path):
+        self.path = Path(journal_path)
+        self.sessions = {}
+        self.part_sessions = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    self._apply(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    # 通常是崩溃时写了一半的最后一行
+                    logging.warning(f"上传日志簿第 {line_no} 行无法解析，已忽略: {e}")
+
+    def _apply(self, event):
+        kind, sid = event['event'], event['session']
+        if kind == 'session':
+            self.sessions[sid] = {
+                'id': sid,
+                'title': event['title'],
+                'parts': event['parts'],
+                'state': PENDING,
+                'attempts': 0,
+                'error': None,
+                'bvid': None,
+                'aid': None,
+                'updated': event['ts'],
+            }
+            for key in event['parts']:
+                self.part_sessions[key] = sid
+            return
+
+        session = self.sessions[sid]
+        session['updated'] = event['ts']
+        if kind == 'parts':
+            session['parts'] = event['parts']
+            for key in event['parts']:
+                self.part_sessions[key] = sid
+        elif kind == 'attempt':
+            session['state'] = UPLOADING
+            session['attempts'] = event['attempt']
+        elif kind == 'failed':
+            session['state'] = FAILED
+            session['error'] = event['error']
+        elif kind == 'submitted':
+            session['state'] = SUBMITTED
+            session['bvid'] = event.get('bvid')
+            session['aid'] = event.get('aid')
+            session['error'] = None
+        elif kind == 'cleaned':
+            session['state'] = CLEANED
+
+    def _append(self, event):
+        event['ts'] = time.time()
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(event)
+
+    # --- 查询 ---
+
+    def session(self, session_id):
+        return self.sessions.get(session_id)
+
+    def part_state(self, key):
+        sid = self.part_sessions.get(key)
+        return self.sessions[sid]['state'] if sid else None
+
+    def is_uploaded(self, key):
+        return self.part_state(key) in DONE_STATES
+
+    def session_of(self, key):
+        return self.part_sessions.get(key)
+
+    # --- 状态变更 ---
+
+    def open_session(self, title, keys):
+        """登记一次投稿；如果这些分段属于一个未完成的会话则继续该会话"""
+        keys = list(keys)
+        for key in keys:
+            sid = self.part_sessions.get(key)
+            if sid and self.sessions[sid]['state'] in UNFINISHED_STATES:
+                session = self.sessions[sid]
+                logging.info(
+                    f"继续未完成的投稿会话 {sid} (状态: {session['state']}, 已尝试 {session['attempts']} 次)")
+                if session['parts'] != keys:
+                    self._append({'event': 'parts', 'session': sid, 'parts': keys})
+                return sid
+
+        sid = uuid.uuid4().hex[:12]
+        self._append({'event': 'session', 'session': sid, 'title': title, 'parts': keys})
+        return sid
+
+    def start_attempt(self, session_id):
+        attempt = self.sessions[session_id]['attempts'] + 1
+        self._append({'event': 'attempt', 'session': session_id, 'attempt': attempt})
+        return attempt
+
+    def mark_failed(self, session_id, error):
+        self._append({'event': 'failed', 'session': session_id, 'error': str(error)})
+
+    def mark_submitted(self, session_id, bvid=None, aid=None):
+        self._append({'event': 'submitted', 'session': session_id, 'bvid': bvid, 'aid': aid})
+
+    def mark_cleaned(self, session_id):
+        self._append({'event': 'cleaned', 'session': session_id})
@@ -0,0 +1,206 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from pathlib import Path
+from urllib.parse import urlsplit
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+# stream_gears.UploadLine 的各条线路对应的上传节点，可在 config.yaml 的 line_probe.targets 中覆盖
+DEFAULT_TARGETS = {
+    'Bda2': 'https://upos-cs-upcdnbda2.bilivideo.com/',
+    'Ws': 'https://upos-cs-upcdnws.bilivideo.com/',
+    'Qn': 'https://upos-cs-upcdnqn.bilivideo.com/',
+    'Bda': 'https://upos-cs-upcdnbda.bilivideo.com/',
+    'Tx': 'https://upos-cs-upcdntx.bilivideo.com/',
+    'Txa': 'https://upos-cs-upcdntxa.bilivideo.com/',
+    'Bldsa': 'https://upos-cs-upcdnbldsa.bilivideo.com/',
+    'Alia': 'https://upos-cs-upcdnalia.bilivideo.com/',
+}
+DEFAULT_TTL = 6 * 3600
+# 所有线路都探测失败时，该结果只缓存较短时间，避免每次上传都重新探测全部线路
+DEFAULT_FAILED_TTL = 600
+DEFAULT_BURST_KB = 1024
+DEFAULT_TIMEOUT = 5
+# 实际上传速率低于该线路近期平均速率的比例时，认为线路变差，下次上传前重新探测
+DEFAULT_DROP_RATIO = 0.5
+LATENCY_SAMPLES = 3
+# 突发测试只在节点返回这些状态码（确认收到了数据）时才计入速率；默认为 2xx
+DEFAULT_EXPECT_STATUS = tuple(range(200, 300))
+SEND_CHUNK_SIZE = 64 * 1024
+# 近期平均速率的平滑系数
+OBSERVED_EMA_WEIGHT = 0.3
+
+
+def probe_target(url, burst_bytes=DEFAULT_BURST_KB * 1024, timeout=DEFAULT_TIMEOUT,
+                 expect_status=DEFAULT_EXPECT_STATUS):
+    """测量一个上传节点: TCP 建连延迟（取最小值）与短时突发上传速率。
+
+    突发测试向节点 PUT burst_bytes 字节，计时到收到响应为止（不含 TLS 握手）。
+    数据可能只是写进了本机的发送缓冲区，节点不读请求体就直接拒绝时响应会很快返回，
+    因此只有状态码在 expect_status 中时才认为节点收到了数据、速率有效（ok）；
+    否则只保留延迟，由调用方按延迟排序。返回 {'latency_ms', 'mbps', 'status', 'ok', 'error'}。
+    """
+    parts = urlsplit(url)
+    https = parts.scheme == 'https'
+    host, port = parts.hostname, parts.port or (443 if https else 80)
+    result = {'latency_ms': None, 'mbps': 0.0, 'status': None, 'ok': False, 'error': None}
+    try:
+        latencies = []
+        for _ in range(LATENCY_SAMPLES):
+            started = time.monotonic()
+            socket.create_connection((host, port), timeout=timeout).close()
+            latencies.append(time.monotonic() - started)
+        rtt = min(latencies)
+        result['latency_ms'] = round(rtt * 1000, 1)
+
+        conn = (HTTPSConnection if https else HTTPConnection)(host, port, timeout=timeout)
+        try:
+            conn.connect()
+            chunk = b'\0' * SEND_CHUNK_SIZE
+            started = time.monotonic()
+            conn.putrequest('PUT', parts.path or '/', skip_accept_encoding=True)
+            conn.putheader('Content-Length', str(burst_bytes))
+            conn.putheader('Content-Type', 'application/octet-stream')
+            conn.endheaders()
+            sent = 0
+            while sent < burst_bytes:
+                n = min(SEND_CHUNK_SIZE, burst_bytes - sent)
+                conn.send(chunk[:n])
+                sent += n
+            response = conn.getresponse()
+            response.read()
+            # 响应需要一个往返才能回来，不计入发送时间
+            elapsed = max(time.monotonic() - started - rtt, 1e-3)
+        finally:
+            conn.close()
+        result['status'] = response.status
+        if response.status not in expect_status:
+            result['error'] = f'节点返回 {response.status}，未确认收到数据'
+            return result
+        result['mbps'] = round(burst_bytes / 1024 / 1024 / elapsed, 2)
+        result['ok'] = True
+    except (OSError, ValueError) as e:
+        result['error'] = str(e)
+    except HTTPException as e:
+        # 节点返回无法解析的响应（如 BadStatusLine）: 整条线路视为探测失败，也不参与按延迟选择
+        result['latency_ms'] = None
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+class LineSelector:
+    """探测各条上传线路并选出最快的一条，结果缓存到 JSON 文件。
+
+    按突发速率选线路；没有线路确认收到突发数据时退而按建连延迟选择。
+    缓存在 ttl 秒内有效（全部失败的结果只缓存 failed_ttl 秒）；上传过程中某条线路的
+    实际速率低于其近期平均的 drop_ratio，或上传出错时，缓存作废，下一次上传尝试前重新探测。
+    多个会话同时请求时只探测一次。
+    """
+
+    def __init__(self, cache_path, probe_cfg=None):
+        probe_cfg = probe_cfg or {}
+        self.path = Path(cache_path)
+        targets = {**DEFAULT_TARGETS, **(probe_cfg.get('targets') or {})}
+        lines = probe_cfg.get('lines') or list(targets)
+        self.targets = {line: targets[line] for line in lines if line in targets}
+        self.ttl = float(probe_cfg.get('ttl', DEFAULT_TTL))
+        self.failed_ttl = float(probe_cfg.get('failed_ttl', DEFAULT_FAILED_TTL))
+        self.expect_status = tuple(int(s) for s in probe_cfg.get('expect_status') or DEFAULT_EXPECT_STATUS)
+        self.burst_bytes = int(float(probe_cfg.get('burst_kb', DEFAULT_BURST_KB)) * 1024)
+        self.timeout = float(probe_cfg.get('timeout', DEFAULT_TIMEOUT))
+        self.drop_ratio = float(probe_cfg.get('drop_ratio', DEFAULT_DROP_RATIO))
+        self._lock = threading.Lock()
+        self.cache = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.cache = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"[线路] 探测缓存无法读取，将重新探测: {e}")
+
+    def _fresh(self):
+        if 'probed_at' not in self.cache or self.cache.get('stale'):
+            return False
+        best = self.cache.get('best')
+        if best is None:
+            ttl = self.failed_ttl
+        elif best in self.targets:
+            ttl = self.ttl
+        else:
+            return False
+        return time.time() - self.cache['probed_at'] < ttl
+
+    def probe(self):
+        """并行探测所有候选线路，返回 {线路: 结果}"""
+        with ThreadPoolExecutor(max_workers=len(self.targets) or 1, thread_name_prefix='probe') as pool:
+            futures = {line: pool.submit(probe_target, url, self.burst_bytes, self.timeout, self.expect_status)
+                       for line, url in self.targets.items()}
+            return {line: future.result() for line, future in futures.items()}
+
+    def select(self):
+        """返回当前最快的线路名；全部探测失败时返回 None（使用 stream_gears 的默认线路）"""
+        with self._lock:
+            if self._fresh():
+                return self.cache['best']
+            if not self.targets:
+                return None
+            started = time.monotonic()
+            results = self.probe()
+            for line, r in results.items():
+                if r['ok']:
+                    logging.info(f"[线路] {line}: 延迟 {r['latency_ms']} ms，突发速率 {r['mbps']:.1f} MB/s")
+                elif r['latency_ms'] is not None:
+                    logging.info(f"[线路] {line}: 延迟 {r['latency_ms']} ms，突发测试无效 ({r['error']})")
+                else:
+                    logging.info(f"[线路] {line}: 探测失败 ({r['error']})")
+            usable = [line for line, r in results.items() if r['ok']]
+            if usable:
+                best = max(usable, key=lambda line: (results[line]['mbps'], -results[line]['latency_ms']))
+                basis = '突发速率'
+            else:
+                reachable = [line for line, r in results.items() if r['latency_ms'] is not None]
+                best = min(reachable, key=lambda line: results[line]['latency_ms'], default=None)
+                basis = '建连延迟'
+            observed = self.cache.get('observed', {})
+            self.cache = {'probed_at': time.time(), 'best': best, 'results': results, 'observed': observed}
+            self._save()
+        if best:
+            logging.info(f"[线路] 探测用时 {time.monotonic() - started:.1f} 秒，按{basis}选用 {best}")
+        else:
+            logging.warning(f"[线路] 所有线路探测失败，{self.failed_ttl:.0f} 秒内使用默认线路。")
+        return best
+
+    def observe(self, line, size_bytes, seconds, ok):
+        """反馈一次上传尝试的结果；线路出错或明显变慢时作废缓存"""
+        if not line:
+            return
+        with self._lock:
+            if not ok:
+                if self.cache.get('best') == line and not self.cache.get('stale'):
+                    logging.info(f"[线路] {line} 上传出错，下次上传前重新探测。")
+                    self.cache['stale'] = True
+                    self._save()
+                return
+            if seconds <= 0:
+                return
+            mbps = size_bytes / 1024 / 1024 / seconds
+            observed = self.cache.setdefault('observed', {})
+            average = observed.get(line)
+            if average and mbps < average * self.drop_ratio and self.cache.get('best') == line:
+                logging.info(f"[线路] {line} 速率降至 {mbps:.1f} MB/s（近期平均 {average:.1f} MB/s），下次上传前重新探测。")
+                self.cache['stale'] = True
+            observed[line] = round(mbps if not average else average + OBSERVED_EMA_WEIGHT * (mbps - average), 2)
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"[线路] 保存探测缓存失败: {e}")
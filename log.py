@@ -1,7 +1,23 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request, abort, jsonify
+from logsearch import LogSearchIndex, parse_time
+from metrics import STAGES
+from array import array
+from collections import Counter, deque
+from datetime import datetime, timezone
+import gzip
+import hashlib
+import json
 import yaml
 import os
 import sys
+import queue
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Determine base directory (for config/logs) and template_folder (for flask)
 if getattr(sys, 'frozen', False):
@@ -17,6 +33,399 @@ else:
 
 app = Flask(__name__, template_folder=template_folder)
 
+# Number of lines rendered per page, and the upper bound for ?tail=N
+LINES_PER_PAGE = 500
+MAX_TAIL_LINES = 5000
+# Chunk size used when scanning a log for newlines
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+class LineIndex:
+    """Byte offsets of every line start in one log file.
+
+    The index is built once and then only extended over the bytes appended
+    since the last refresh, so a page request costs one stat() plus a seek
+    and a read of the lines it shows. If the file was replaced, truncated
+    (up.py opens its log with mode='w') or rewritten in place, the index is
+    rebuilt from scratch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset(None, 0)
+
+    def _reset(self, inode, mtime):
+        self.inode = inode
+        self.mtime = mtime
+        self.size = 0
+        # starts[i] is the offset of line i; starts[-1] is the end of the last complete line
+        self.starts = array('Q', [0])
+
+    def refresh(self):
+        st = os.stat(self.path)
+        with self.lock:
+            if (st.st_ino != self.inode
+                    or st.st_size < self.size
+                    or (st.st_size == self.size and st.st_mtime_ns != self.mtime)
+                    or not self._tail_is_intact()):
+                self._reset(st.st_ino, st.st_mtime_ns)
+            if st.st_size > self.starts[-1]:
+                self._scan(st.st_size)
+            self.size = st.st_size
+            self.mtime = st.st_mtime_ns
+
+    def _tail_is_intact(self):
+        # A file truncated and rewritten past its old size between two refreshes
+        # keeps its inode and grows, so check the last indexed newline is still there
+        end = self.starts[-1]
+        if end == 0:
+            return True
+        with open(self.path, 'rb') as f:
+            f.seek(end - 1)
+            return f.read(1) == b'\n'
+
+    def _scan(self, size):
+        pos = self.starts[-1]
+        starts = self.starts
+        with open(self.path, 'rb') as f:
+            f.seek(pos)
+            while pos < size:
+                chunk = f.read(min(SCAN_CHUNK_SIZE, size - pos))
+                if not chunk:
+                    break
+                i = chunk.find(b'\n')
+                while i != -1:
+                    starts.append(pos + i + 1)
+                    i = chunk.find(b'\n', i + 1)
+                pos += len(chunk)
+
+    def line_count(self):
+        # Complete lines, plus the partial last line while it is still being written
+        return len(self.starts) - 1 + (1 if self.size > self.starts[-1] else 0)
+
+    def read_lines(self, first, last):
+        """Return lines [first, last) by reading only their byte range."""
+        with self.lock:
+            last = min(last, self.line_count())
+            if first >= last:
+                return []
+            begin = self.starts[first]
+            end = self.starts[last] if last < len(self.starts) else self.size
+        with open(self.path, 'rb') as f:
+            f.seek(begin)
+            data = f.read(end - begin)
+        return data.decode('utf-8', errors='replace').splitlines()
+
+_line_indexes = {}
+_line_indexes_lock = threading.Lock()
+
+def get_line_index(log_file_path):
+    with _line_indexes_lock:
+        index = _line_indexes.get(log_file_path)
+        if index is None:
+            index = _line_indexes[log_file_path] = LineIndex(log_file_path)
+    index.refresh()
+    return index
+
+# Live tail (Server-Sent Events)
+FOLLOW_POLL_INTERVAL = 0.5
+SSE_KEEPALIVE_SECONDS = 15
+# Lines a slow client may fall behind before it is dropped and has to reconnect
+SUBSCRIBER_QUEUE_SIZE = 10000
+# Upper bound on the catch-up a reconnecting client gets replayed from disk
+MAX_BACKLOG_BYTES = 1024 * 1024
+
+class LogFollower:
+    """Follows one log file and fans new lines out to every connected client.
+
+    A single polling thread runs per file while at least one client is
+    subscribed, so any number of open tabs costs one stat() per poll. Only
+    complete lines are delivered; a truncation or replacement of the file
+    (up.py rewrites its log on every run) is broadcast as a reset.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.thread = None
+        self.inode = None
+        self.offset = 0
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            if self.thread is None:
+                line_index = get_line_index(self.path)
+                self.inode = line_index.inode
+                self.offset = line_index.starts[-1]
+                self.thread = threading.Thread(target=self._run, name=f'follow:{os.path.basename(self.path)}', daemon=True)
+                self.thread.start()
+            else:
+                # The running thread may be up to one poll behind the page the client just
+                # rendered; catch up first so a fresh page is not mistaken for a truncation
+                try:
+                    self._poll()
+                except OSError:
+                    pass
+            self.subscribers.add(q)
+            return q, self.offset
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def is_subscribed(self, q):
+        with self.lock:
+            return q in self.subscribers
+
+    def _run(self):
+        while True:
+            time.sleep(FOLLOW_POLL_INTERVAL)
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    return
+                try:
+                    self._poll()
+                except OSError:
+                    # The log may be briefly missing while up.py recreates it
+                    pass
+
+    def _poll(self):
+        st = os.stat(self.path)
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            self.inode = st.st_ino
+            self.offset = 0
+            self._broadcast(('reset', 0, ''))
+        if st.st_size <= self.offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(st.st_size - self.offset)
+        end = data.rfind(b'\n')
+        if end == -1:
+            return
+        pos = self.offset
+        for raw in data[:end + 1].splitlines(keepends=True):
+            pos += len(raw)
+            self._broadcast(('line', pos, raw.decode('utf-8', errors='replace').rstrip('\r\n')))
+        self.offset = pos
+
+    def _broadcast(self, item):
+        for q in list(self.subscribers):
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                # Drop the client; its EventSource reconnects with Last-Event-ID and catches up from disk
+                self.subscribers.discard(q)
+
+_followers = {}
+_followers_lock = threading.Lock()
+
+def get_follower(log_file_path):
+    with _followers_lock:
+        follower = _followers.get(log_file_path)
+        if follower is None:
+            follower = _followers[log_file_path] = LogFollower(log_file_path)
+        return follower
+
+def _sse(event, event_id, data):
+    head = f'event: {event}\n' if event != 'line' else ''
+    return f'{head}id: {event_id}\ndata: {data}\n\n'
+
+def _read_backlog(log_file_path, start, end):
+    # Replay what a reconnecting client missed, skipping to a line boundary if it is too far behind
+    if end - start > MAX_BACKLOG_BYTES:
+        start = end - MAX_BACKLOG_BYTES
+        with open(log_file_path, 'rb') as f:
+            f.seek(start)
+            start += len(f.readline())
+    with open(log_file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    pos = start
+    for raw in data.splitlines(keepends=True):
+        pos += len(raw)
+        yield _sse('line', pos, raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+# Search index over all logs, kept next to config.yaml
+SEARCH_DB_NAME = 'log_index.db'
+MAX_SEARCH_RESULTS = 1000
+_search_index = None
+_search_index_lock = threading.Lock()
+
+def get_search_index():
+    global _search_index
+    with _search_index_lock:
+        if _search_index is None:
+            _search_index = LogSearchIndex(os.path.join(base_dir, SEARCH_DB_NAME))
+        return _search_index
+
+# Upload run metrics appended by up.py, one JSON line per run
+METRICS_FILE_NAME = 'metrics.jsonl'
+STAGE_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 10800)
+THROUGHPUT_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+# Runs kept in memory for the trend page
+TREND_RUNS = 200
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Cumulative, as the Prometheus text format expects
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+def _run_result(run):
+    code = run.get('exit_code')
+    return 'error' if code is None else 'ok' if code == 0 else 'failed'
+
+class MetricsAggregate:
+    """Counters and histograms aggregated from metrics.jsonl.
+
+    The file only ever grows by whole lines, so a refresh parses just the
+    bytes appended since the previous one; a file that shrank or was
+    replaced is read again from the start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.mtime = None
+        self.runs = Counter()       # (streamer, result)
+        self.sessions = Counter()   # (streamer, result)
+        self.bytes = Counter()      # streamer
+        self.parts = Counter()
+        self.retries = Counter()
+        self.stages = {}            # stage -> Histogram
+        self.throughput = Histogram(THROUGHPUT_BUCKETS)
+        self.last = {}              # streamer -> latest run
+        self.recent = deque(maxlen=TREND_RUNS)
+
+    def refresh(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            with self.lock:
+                self._reset(None)
+            return
+        with self.lock:
+            if st.st_ino != self.inode or st.st_size < self.offset:
+                self._reset(st.st_ino)
+            self.mtime = st.st_mtime
+            if st.st_size <= self.offset:
+                return
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(st.st_size - self.offset)
+            end = data.rfind(b'\n')
+            if end == -1:
+                return
+            self.offset += end + 1
+            for raw in data[:end].splitlines():
+                try:
+                    self._add(json.loads(raw))
+                except (ValueError, TypeError, AttributeError):
+                    continue
+
+    def _add(self, run):
+        streamer = run.get('streamer') or ''
+        self.runs[streamer, _run_result(run)] += 1
+        for session in run.get('sessions', []):
+            self.sessions[streamer, 'ok' if session.get('ok') else 'failed'] += 1
+            if session.get('ok'):
+                self.throughput.observe(session.get('mbps', 0))
+        self.bytes[streamer] += run.get('bytes', 0)
+        self.parts[streamer] += run.get('parts', 0)
+        self.retries[streamer] += run.get('retries', 0)
+        for stage, values in run.get('stages', {}).items():
+            histogram = self.stages.setdefault(stage, Histogram(STAGE_BUCKETS))
+            for value in values:
+                histogram.observe(value)
+        self.last[streamer] = run
+        self.recent.append(run)
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_label(v)}"' for k, v in labels.items()) + '}' if labels else ''
+
+def _render_prometheus(m):
+    out = []
+
+    def metric(name, kind, help_text, samples):
+        out.append(f'# HELP {name} {help_text}')
+        out.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            out.append(f'{name}{_labels(**labels)} {value}')
+
+    def histogram(name, help_text, histograms):
+        out.append(f'# HELP {name} {help_text}')
+        out.append(f'# TYPE {name} histogram')
+        for labels, h in histograms:
+            for bound, count in zip(h.buckets, h.counts):
+                out.append(f'{name}_bucket{_labels(**labels, le=bound)} {count}')
+            out.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {h.count}')
+            out.append(f'{name}_sum{_labels(**labels)} {h.sum:.4f}')
+            out.append(f'{name}_count{_labels(**labels)} {h.count}')
+
+    metric('upload_runs_total', 'counter', 'Upload runs by streamer and result.',
+           [({'streamer': s, 'result': r}, n) for (s, r), n in sorted(m.runs.items())])
+    metric('upload_sessions_total', 'counter', 'Upload sessions (one submission each) by streamer and result.',
+           [({'streamer': s, 'result': r}, n) for (s, r), n in sorted(m.sessions.items())])
+    metric('upload_bytes_total', 'counter', 'Bytes of successfully submitted parts.',
+           [({'streamer': s}, n) for s, n in sorted(m.bytes.items())])
+    metric('upload_parts_total', 'counter', 'Successfully submitted parts.',
+           [({'streamer': s}, n) for s, n in sorted(m.parts.items())])
+    metric('upload_retries_total', 'counter', 'Upload attempts that were retries.',
+           [({'streamer': s}, n) for s, n in sorted(m.retries.items())])
+    histogram('upload_stage_duration_seconds', 'Duration of each pipeline stage.',
+              [({'stage': stage}, m.stages[stage])
+               for stage in sorted(m.stages, key=lambda s: (STAGES.index(s) if s in STAGES else len(STAGES), s))])
+    histogram('upload_session_throughput_mbps', 'Achieved MB/s of successful upload sessions.',
+              [({}, m.throughput)])
+    metric('upload_last_run_duration_seconds', 'gauge', 'Duration of the latest run.',
+           [({'streamer': s}, run.get('duration', 0)) for s, run in sorted(m.last.items())])
+    metric('upload_last_run_timestamp_seconds', 'gauge', 'Start time of the latest run.',
+           [({'streamer': s}, int(datetime.fromisoformat(run['started']).timestamp()))
+            for s, run in sorted(m.last.items()) if run.get('started')])
+    return '\n'.join(out) + '\n'
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+def get_metrics_aggregate():
+    path = load_config().get('paths', {}).get('metrics_file') or METRICS_FILE_NAME
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    with _aggregates_lock:
+        aggregate = _aggregates.get(path)
+        if aggregate is None:
+            aggregate = _aggregates[path] = MetricsAggregate(path)
+    aggregate.refresh()
+    return aggregate
+
+def _int_arg(name):
+    try:
+        value = int(request.args.get(name, ''))
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
 def get_log_colors():
     return {
         'INFO': 'lightgray',
@@ -26,9 +435,28 @@ def get_log_colors():
         'CRITICAL': 'magenta'
     }
 
-@app.route('/')
-def index():
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Part of every ETag, so a restarted (possibly upgraded) viewer never answers 304 for an old page
+ETAG_SALT = f'{os.getpid()}-{time.time_ns()}'
+
+_config_cache = {'key': None, 'config': {}}
+_listing_cache = {}
+_cache_lock = threading.Lock()
+
+def load_config():
+    # Re-parse config.yaml only when its mtime or size changes
     config_path = os.path.join(base_dir, 'config.yaml')
+    try:
+        st = os.stat(config_path)
+        key = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = None
+    with _cache_lock:
+        if key is not None and key == _config_cache['key']:
+            return _config_cache['config']
     try:
         with open(config_path, 'r', encoding='utf-8') as f:
             config = yaml.safe_load(f)
@@ -36,6 +464,13 @@ def index():
             config = {}
     except (IOError, yaml.YAMLError):
         config = {}
+    with _cache_lock:
+        _config_cache['key'] = key
+        _config_cache['config'] = config
+    return config
+
+def get_log_directory():
+    config = load_config()
 
     log_directory = config.get('paths', {}).get('log_file', base_dir)
     # Get the directory part from the log_file path
@@ -45,24 +480,208 @@ def index():
     # If the configured directory is a relative path, make it absolute based on the base_dir
     if not os.path.isabs(log_directory):
         log_directory = os.path.join(base_dir, log_directory)
+    return log_directory
 
+def list_log_files(log_directory):
+    # A directory's mtime changes whenever an entry is created, renamed or removed
+    try:
+        dir_mtime = os.stat(log_directory).st_mtime_ns
+    except OSError:
+        return []
+    with _cache_lock:
+        cached = _listing_cache.get(log_directory)
+        if cached and cached[0] == dir_mtime:
+            return cached[1]
     log_files = []
     if os.path.isdir(log_directory):
-        log_files = [f for f in os.listdir(log_directory) if f.endswith('.log')]
+        log_files = sorted(f for f in os.listdir(log_directory) if f.endswith('.log'))
+    with _cache_lock:
+        _listing_cache[log_directory] = (dir_mtime, log_files)
+    return log_files
+
+def _validators(*parts, mtime=None):
+    etag = hashlib.blake2b(repr((ETAG_SALT,) + parts).encode('utf-8'), digest_size=12).hexdigest()
+    last_modified = datetime.fromtimestamp(mtime, timezone.utc).replace(microsecond=0) if mtime else None
+    return etag, last_modified
+
+def _not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+def _set_validators(response, etag, last_modified):
+    # Weak, because the same page is sent identity, gzip or br encoded
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _conditional(etag, last_modified, render):
+    if _not_modified(etag, last_modified):
+        return _set_validators(Response(status=304), etag, last_modified)
+    response = app.make_response(render())
+    return _set_validators(response, etag, last_modified)
+
+@app.after_request
+def compress_response(response):
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype == 'text/event-stream'):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/')
+def index():
+    log_directory = get_log_directory()
+    log_files = list_log_files(log_directory)
 
     selected_file = request.args.get('file')
+    if selected_file and selected_file in log_files:
+        try:
+            st = os.stat(os.path.join(log_directory, selected_file))
+            file_key, mtime = (st.st_ino, st.st_size, st.st_mtime_ns), st.st_mtime
+        except OSError:
+            file_key, mtime = None, None
+    else:
+        file_key, mtime = None, None
+    # Most polls hit a log that has not changed since the previous one; answer those without reading it
+    etag, last_modified = _validators(
+        tuple(log_files), selected_file, file_key, request.args.get('page'), request.args.get('tail'), mtime=mtime)
+    return _conditional(etag, last_modified, lambda: _render_index(log_directory, log_files, selected_file))
+
+def _render_index(log_directory, log_files, selected_file):
     logs = []
+    page = pages = 1
+    stream_offset = None
+    tail = _int_arg('tail')
     if selected_file and selected_file in log_files:
         log_file_path = os.path.join(log_directory, selected_file)
         try:
-            with open(log_file_path, 'r', encoding='utf-8') as f:
-                logs = f.readlines()
+            line_index = get_line_index(log_file_path)
+            total = line_index.line_count()
+            stream_offset = line_index.starts[-1]
+            pages = max(1, (total + LINES_PER_PAGE - 1) // LINES_PER_PAGE)
+            if tail:
+                tail = min(tail, MAX_TAIL_LINES)
+                logs = line_index.read_lines(max(0, total - tail), total)
+                page = pages
+            else:
+                # Default to the last page, which is where new log lines show up
+                page = min(_int_arg('page') or pages, pages)
+                first = (page - 1) * LINES_PER_PAGE
+                logs = line_index.read_lines(first, first + LINES_PER_PAGE)
         except Exception as e:
             logs = [f"Error reading file: {e}"]
 
     log_colors = get_log_colors()
     
-    return render_template('index.html', logs=logs, log_colors=log_colors, log_files=log_files, selected_file=selected_file)
+    return render_template('index.html', logs=logs, log_colors=log_colors, log_files=log_files, selected_file=selected_file,
+                           page=page, pages=pages, tail=tail, stream_offset=stream_offset)
+
+@app.route('/stream')
+def stream():
+    log_directory = get_log_directory()
+    selected_file = request.args.get('file')
+    if not selected_file or selected_file not in list_log_files(log_directory):
+        abort(404)
+    log_file_path = os.path.join(log_directory, selected_file)
+
+    # EventSource sends the id of the last line it saw when it reconnects
+    start = request.headers.get('Last-Event-ID') or request.args.get('offset')
+    try:
+        start = int(start) if start is not None else None
+    except ValueError:
+        start = None
+
+    follower = get_follower(log_file_path)
+    q, offset = follower.subscribe()
+
+    def generate():
+        try:
+            if start is not None and start > offset:
+                # The file was truncated since the client last saw it
+                yield _sse('reset', 0, '')
+                yield from _read_backlog(log_file_path, 0, offset)
+            elif start is not None and start < offset:
+                yield from _read_backlog(log_file_path, start, offset)
+            while True:
+                try:
+                    event, event_id, data = q.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    if not follower.is_subscribed(q):
+                        return
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse(event, event_id, data)
+        finally:
+            follower.unsubscribe(q)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/search')
+def search():
+    log_directory = get_log_directory()
+    log_files = list_log_files(log_directory)
+    try:
+        since = parse_time(request.args['since']) if request.args.get('since') else None
+        until = parse_time(request.args['until']) if request.args.get('until') else None
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    selected_file = request.args.get('file') or None
+    if selected_file and selected_file not in log_files:
+        abort(404)
+
+    started = time.perf_counter()
+    search_index = get_search_index()
+    # Only the bytes appended since the previous search are parsed here
+    search_index.update(log_directory, log_files)
+    results = search_index.search(
+        q=request.args.get('q', '').strip() or None,
+        level=request.args.get('level') or None,
+        since=since,
+        until=until,
+        file=selected_file,
+        limit=min(_int_arg('limit') or 200, MAX_SEARCH_RESULTS),
+    )
+    return jsonify(results=results, took_ms=round((time.perf_counter() - started) * 1000, 1))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    aggregate = get_metrics_aggregate()
+    with aggregate.lock:
+        body = _render_prometheus(aggregate)
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/trends')
+def trends():
+    aggregate = get_metrics_aggregate()
+    with aggregate.lock:
+        key = (aggregate.inode, aggregate.offset)
+        mtime = aggregate.mtime
+        runs = list(reversed(aggregate.recent))
+    etag, last_modified = _validators('trends', key, mtime=mtime)
+    max_mbps = max((run.get('mbps', 0) for run in runs), default=0) or 1
+    return _conditional(etag, last_modified, lambda: render_template(
+        'trends.html', runs=runs, stages=STAGES, max_mbps=max_mbps, result=_run_result))
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0',debug=True)
@@ -1,29 +1,49 @@
-import stream_gears
-import qrcode
+from pathlib import Path
+import argparse
 import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
 import time
 
-def login():
+# 扫码登录轮询: 首次间隔、最大间隔与整体超时（二维码约 180 秒后失效）
+QR_POLL_INTERVAL = 2
+QR_POLL_MAX_INTERVAL = 10
+QR_TIMEOUT = 180
+# 凭据剩余有效期少于该天数时主动续期
+DEFAULT_REFRESH_MARGIN_DAYS = 10
+# 后台续期线程的最长检查间隔与续期失败后的重试间隔
+DEFAULT_CHECK_INTERVAL = 12 * 3600
+REFRESH_RETRY_INTERVAL = 300
+REFRESH_RETRY_MAX_INTERVAL = 3600
+
+def login(cookie_file='cookies.json', proxy=None):
 
     """
-    使用 stream_gears 进行扫码登录
+    使用 stream_gears 进行扫码登录，成功返回 True
     """
+    import stream_gears
+    import qrcode
+
+    cookie_file = Path(cookie_file).resolve()
     try:
         # 1. 获取二维码数据
         # 注意：这里的 proxy 参数是可选的，如果不需要代理可以设为 None
-        login_info_str = stream_gears.get_qrcode(proxy=None)
-        ("获取二维码成功...")
-        
+        login_info_str = stream_gears.get_qrcode(proxy=proxy)
+        print("获取二维码成功...")
+
         # 2. 解析URL并生成二维码
         login_info = json.loads(login_info_str)
         qr_url = login_info['data']['url']
-        
+
         # 在终端显示二维码
         qr = qrcode.QRCode()
         qr.add_data(qr_url)
         qr.make(fit=True)
         # invert=True 可以让它在深色背景的终端上正确显示
-        qr.print_ascii(invert=True) 
+        qr.print_ascii(invert=True)
 
         print("请使用Bilibili手机客户端扫描上方二维码。")
         print("或者，您也可以在程序同目录下找到 qrcode.png 文件进行扫描。")
@@ -32,28 +52,168 @@ def login():
         img = qr.make_image(fill_color="black", back_color="white")
         img.save("qrcode.png")
 
-        # 3. 轮询等待登录结果
+        # 3. 轮询等待登录结果：每次失败后等待，间隔逐步拉长，超时后放弃
         print("等待扫码登录...")
-        expiration_time = time.time() + 180  # 设置一个180秒的超时时间
-        
-        while time.time() < expiration_time:
-            # 将完整的JSON字符串传给 login_by_qrcode
-            is_logged_in = stream_gears.login_by_qrcode(login_info_str, proxy=None)
-            
+        expiration_time = time.monotonic() + QR_TIMEOUT
+        interval = QR_POLL_INTERVAL
+        # stream_gears 把登录结果写入当前目录下的 cookies.json
+        os.chdir(cookie_file.parent)
+        while time.monotonic() < expiration_time:
+            try:
+                is_logged_in = stream_gears.login_by_qrcode(login_info_str, proxy=proxy)
+            except Exception as e:
+                # 尚未扫码或尚未确认时会返回错误，继续等待
+                is_logged_in = False
+                logging.debug(f"扫码登录尚未完成: {e}")
+
             if is_logged_in:
-                print("登录成功！")
-                # 解析返回的JSON字符串
-                login_data = json.loads(is_logged_in)
-                # 保存为cookies.json
-                with open('cookies.json', 'w', encoding='utf-8') as f:
-                    json.dump(login_data, f, ensure_ascii=False, indent=4)
-
-                print("Cookie已成功提取并保存到 cookies.json")
-            return False
-        
+                if cookie_file.name != 'cookies.json':
+                    os.replace('cookies.json', cookie_file)
+                print(f"登录成功！Cookie已保存到 {cookie_file}")
+                return True
+            time.sleep(min(interval, max(0.0, expiration_time - time.monotonic())))
+            interval = min(interval * 1.5, QR_POLL_MAX_INTERVAL)
+
+        print("二维码已过期，请重新运行登录。")
+        return False
+
     except Exception as e:
         print(f"发生错误: {e}")
         return False
 
+class CredentialService:
+    """B 站登录凭据的有效期检查与续期。
+
+    有效期从 cookies 文件中读取（SESSDATA 的 expires，或登录时间 + token 的
+    expires_in），按文件修改时间缓存，不必每次都解析。剩余有效期少于
+    refresh_margin_days 时调用 stream_gears.login_by_cookies 验证并续期；
+    续期作用在临时副本上，成功后原子替换原文件，中途失败不会损坏原文件。
+    start() 启动后台线程，在到期前自动续期。
+    """
+
+    def __init__(self, cookie_file, login_cfg=None):
+        login_cfg = login_cfg or {}
+        self.cookie_file = Path(cookie_file)
+        self.proxy = login_cfg.get('proxy')
+        self.margin = float(login_cfg.get('refresh_margin_days', DEFAULT_REFRESH_MARGIN_DAYS)) * 86400
+        self.check_interval = float(login_cfg.get('check_interval', DEFAULT_CHECK_INTERVAL))
+        self._lock = threading.Lock()
+        self._cache = None  # (mtime_ns, 到期时间戳)
+        self._thread = None
+
+    def expires_at(self):
+        """返回凭据到期的 Unix 时间戳；无法判断时返回 None"""
+        try:
+            mtime = self.cookie_file.stat().st_mtime_ns
+        except OSError:
+            return None
+        if self._cache and self._cache[0] == mtime:
+            return self._cache[1]
+        expires = None
+        try:
+            with open(self.cookie_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            cookies = (data.get('cookie_info') or {}).get('cookies') or []
+            expires = next((c.get('expires') for c in cookies if c.get('name') == 'SESSDATA' and c.get('expires')), None)
+            if expires is None and (data.get('token_info') or {}).get('expires_in'):
+                expires = mtime / 1e9 + float(data['token_info']['expires_in'])
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"无法解析 Cookies 文件 {self.cookie_file.name}: {e}")
+        self._cache = (mtime, expires)
+        return expires
+
+    def remaining(self):
+        """剩余有效秒数；无法判断时返回 None"""
+        expires = self.expires_at()
+        return None if expires is None else expires - time.time()
+
+    def refresh(self):
+        """验证并续期凭据，成功返回 True"""
+        with self._lock:
+            try:
+                import stream_gears
+                with tempfile.TemporaryDirectory() as work_dir:
+                    work_file = Path(work_dir) / self.cookie_file.name
+                    shutil.copyfile(self.cookie_file, work_file)
+                    before = work_file.read_bytes()
+                    ok = bool(stream_gears.login_by_cookies(str(work_file), self.proxy))
+                    if ok and work_file.read_bytes() != before:
+                        tmp_path = self.cookie_file.with_name(self.cookie_file.name + '.tmp')
+                        shutil.copyfile(work_file, tmp_path)
+                        os.replace(tmp_path, self.cookie_file)
+            except Exception as e:
+                logging.error(f"[登录] 凭据续期失败: {e}")
+                return False
+        if not ok:
+            logging.error("[登录] Cookies 已失效，请重新运行 login 扫码登录。")
+            return False
+        remaining = self.remaining()
+        logging.info("[登录] 凭据验证成功" + (f"，剩余有效期 {remaining / 86400:.1f} 天" if remaining else ""))
+        return True
+
+    def ensure_fresh(self):
+        """上传前检查: 临近到期时先续期。返回凭据是否可用（无法判断有效期时视为可用）"""
+        remaining = self.remaining()
+        if remaining is None or remaining > self.margin:
+            return True
+        logging.info(f"[登录] 凭据剩余有效期 {max(remaining, 0) / 86400:.1f} 天，尝试续期...")
+        if self.refresh():
+            return True
+        return remaining > 0
+
+    def start(self):
+        """启动后台续期线程（重复调用无效）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'credential-{self.cookie_file.stem}', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        retry = REFRESH_RETRY_INTERVAL
+        while True:
+            remaining = self.remaining()
+            if remaining is not None and remaining <= self.margin:
+                if self.refresh():
+                    retry = REFRESH_RETRY_INTERVAL
+                else:
+                    time.sleep(retry)
+                    retry = min(retry * 2, REFRESH_RETRY_MAX_INTERVAL)
+                    continue
+                remaining = self.remaining()
+            # 睡到进入续期窗口为止，但至少每个检查间隔醒来一次（文件可能被手动更新）；
+            # 验证成功但有效期没有延长时，等一个检查间隔再试
+            if remaining is None or remaining <= self.margin:
+                wait = self.check_interval
+            else:
+                wait = min(self.check_interval, remaining - self.margin)
+            time.sleep(max(wait, REFRESH_RETRY_INTERVAL))
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_credential_service(cookie_file, login_cfg=None):
+    """同一进程中每个 cookies 文件共用一个 CredentialService"""
+    key = str(Path(cookie_file).resolve())
+    with _services_lock:
+        if key not in _services:
+            _services[key] = CredentialService(cookie_file, login_cfg)
+        return _services[key]
+
+
 if __name__ == '__main__':
-    login()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='B 站扫码登录与凭据检查')
+    parser.add_argument('--cookies', default='cookies.json', help='Cookies 文件路径, 默认当前目录下的 cookies.json')
+    parser.add_argument('--check', action='store_true', help='显示凭据剩余有效期')
+    parser.add_argument('--refresh', action='store_true', help='立即验证并续期凭据')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.check or args.refresh:
+        service = CredentialService(args.cookies)
+        if args.refresh and not service.refresh():
+            raise SystemExit(1)
+        remaining = service.remaining()
+        print("无法判断有效期" if remaining is None else f"剩余有效期 {remaining / 86400:.1f} 天")
+    else:
+        raise SystemExit(0 if login(args.cookies) else 1)
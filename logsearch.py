@@ -0,0 +1,216 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+
+# Lines are written by logging with format '%(asctime)s - %(levelname)s - %(message)s'
+LINE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3} - ([A-Z]+) - ')
+BVID_RE = re.compile(r'BV[0-9A-Za-z]{10}')
+FILE_NAME_RE = re.compile(r'[^\s\'"/\\:：]+\.(?:ts|mp4|flv|jpg|log)\b', re.IGNORECASE)
+WORD_RE = re.compile(r'[A-Za-z0-9]{2,}')
+CJK_RE = re.compile(r'[一-鿿]+')
+
+# Width of a timestamp bucket in seconds
+BUCKET_SECONDS = 3600
+# Bytes hashed at the start of a file to recognise a log rewritten in place
+HEAD_BYTES = 256
+INSERT_BATCH_LINES = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    inode INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    head INTEGER,
+    indexed_to INTEGER,
+    generation INTEGER
+);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    file TEXT,
+    generation INTEGER,
+    offset INTEGER,
+    ts INTEGER,
+    bucket INTEGER,
+    level TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS lines_level_ts ON lines(level, ts);
+CREATE INDEX IF NOT EXISTS lines_bucket ON lines(bucket);
+CREATE INDEX IF NOT EXISTS lines_file_gen_offset ON lines(file, generation, offset);
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT,
+    line_id INTEGER,
+    PRIMARY KEY (token, line_id)
+) WITHOUT ROWID;
+"""
+
+
+def tokenize(text):
+    """Split a log line into index tokens.
+
+    BVIDs and video/log file names are kept whole, ASCII words are lowercased
+    and CJK runs become overlapping bigrams, so a Chinese phrase such as
+    '上传失败' can be looked up without word segmentation.
+    """
+    tokens = set(BVID_RE.findall(text))
+    tokens.update(name.lower() for name in FILE_NAME_RE.findall(text))
+    tokens.update(word.lower() for word in WORD_RE.findall(text))
+    for run in CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def parse_time(value):
+    """Parse 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM' or 'YYYY-MM-DD HH:MM:SS' into an epoch timestamp."""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return int(time.mktime(datetime.strptime(value.strip(), fmt).timetuple()))
+        except ValueError:
+            continue
+    raise ValueError(f'unrecognised time: {value!r}')
+
+
+class LogSearchIndex:
+    """Persistent SQLite index over every .log file in one directory.
+
+    Each file is indexed incrementally from the offset reached last time.
+    When a log is truncated or replaced (up.py rewrites its log on every run)
+    indexing restarts under a new generation and the lines of earlier runs
+    stay searchable, so the index keeps the history the log files lose.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def update(self, log_directory, log_files):
+        with self.lock:
+            for name in log_files:
+                try:
+                    self._update_file(name, os.path.join(log_directory, name))
+                except OSError:
+                    continue
+
+    def _update_file(self, name, path):
+        st = os.stat(path)
+        row = self.conn.execute(
+            'SELECT inode, size, mtime_ns, head, indexed_to, generation FROM files WHERE name = ?', (name,)).fetchone()
+        if row and row[0] == st.st_ino and row[1] == st.st_size and row[2] == st.st_mtime_ns:
+            return
+
+        if row is None:
+            generation, start = 0, 0
+        elif (row[0] != st.st_ino or st.st_size < row[4]
+                or row[3] != _head_checksum(path, min(HEAD_BYTES, row[4]))):
+            generation, start = row[5] + 1, 0
+        else:
+            generation, start = row[5], row[4]
+
+        indexed_to = self._index_range(name, path, generation, start, st.st_size)
+        head = _head_checksum(path, min(HEAD_BYTES, indexed_to))
+        self.conn.execute(
+            'INSERT OR REPLACE INTO files (name, inode, size, mtime_ns, head, indexed_to, generation) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (name, st.st_ino, st.st_size, st.st_mtime_ns, head, indexed_to, generation))
+        self.conn.commit()
+
+    def _index_range(self, name, path, generation, start, size):
+        # Continuation lines (tracebacks) inherit the timestamp and level of the record they belong to
+        prev = self.conn.execute(
+            'SELECT ts, level FROM lines WHERE file = ? AND generation = ? ORDER BY offset DESC LIMIT 1',
+            (name, generation)).fetchone()
+        ts, level = prev if prev else (None, None)
+
+        pos = start
+        batch = []
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while pos < size:
+                raw = f.readline(size - pos)
+                if not raw.endswith(b'\n'):
+                    # Partial line still being written; pick it up next time
+                    break
+                text = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                match = LINE_RE.match(text)
+                if match:
+                    try:
+                        ts = int(time.mktime(datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S').timetuple()))
+                    except ValueError:
+                        pass
+                    level = match.group(2)
+                batch.append((pos, ts, level, text))
+                pos += len(raw)
+                if len(batch) >= INSERT_BATCH_LINES:
+                    self._insert(name, generation, batch)
+                    batch = []
+        if batch:
+            self._insert(name, generation, batch)
+        return pos
+
+    def _insert(self, name, generation, batch):
+        cur = self.conn.cursor()
+        token_rows = []
+        for offset, ts, level, text in batch:
+            bucket = ts // BUCKET_SECONDS if ts is not None else None
+            cur.execute(
+                'INSERT INTO lines (file, generation, offset, ts, bucket, level, text) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (name, generation, offset, ts, bucket, level, text))
+            line_id = cur.lastrowid
+            token_rows.extend((token, line_id) for token in tokenize(text))
+        cur.executemany('INSERT OR IGNORE INTO tokens (token, line_id) VALUES (?, ?)', token_rows)
+
+    def search(self, q=None, level=None, since=None, until=None, file=None, limit=200):
+        """Return matching lines, newest first.
+
+        ``q`` is narrowed down through the token index and then matched as a
+        case-insensitive substring, so ASCII words, BVIDs and file names must
+        be given whole while Chinese text may be any fragment of two or more
+        characters. ``since``/``until`` are epoch timestamps.
+        """
+        where, params = [], []
+        if q:
+            tokens = tokenize(q)
+            if tokens:
+                where.append('id IN (' + ' INTERSECT '.join(
+                    'SELECT line_id FROM tokens WHERE token = ?' for _ in tokens) + ')')
+                params.extend(tokens)
+            where.append('instr(lower(text), ?) > 0')
+            params.append(q.lower())
+        if level:
+            where.append('level = ?')
+            params.append(level.upper())
+        if since is not None:
+            where.append('bucket >= ? AND ts >= ?')
+            params.extend((since // BUCKET_SECONDS, since))
+        if until is not None:
+            where.append('bucket <= ? AND ts <= ?')
+            params.extend((until // BUCKET_SECONDS, until))
+        if file:
+            where.append('file = ?')
+            params.append(file)
+
+        sql = 'SELECT file, ts, level, text FROM lines'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [{'file': r[0], 'ts': r[1], 'level': r[2], 'text': r[3]} for r in rows]
+
+
+def _head_checksum(path, length):
+    with open(path, 'rb') as f:
+        return zlib.crc32(f.read(length))
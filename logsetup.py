@@ -0,0 +1,181 @@
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from pathlib import Path
+import atexit
+import contextvars
+import functools
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import time
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DEFAULT_MAX_MB = 10
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_ROTATE_WHEN = 'midnight'
+# 通过 logging 的 extra 参数附加到记录上的结构化字段
+RECORD_FIELDS = ('streamer', 'session', 'parts', 'part', 'bytes', 'elapsed')
+
+_listener = None
+# 当前线程正在处理的主播；记录产生时写入 record.streamer，供 StreamerFilter 按主播分流
+_current_streamer = contextvars.ContextVar('streamer', default=None)
+
+
+@contextmanager
+def streamer_context(name):
+    """在 with 块中把当前线程产生的日志记录标记为属于主播 name"""
+    token = _current_streamer.set(name)
+    try:
+        yield
+    finally:
+        _current_streamer.reset(token)
+
+
+def current_streamer():
+    return _current_streamer.get()
+
+
+def bind_streamer(func):
+    """包装 func，使其在线程池中执行时沿用提交时的主播标记（线程池的线程不继承 contextvar）"""
+    streamer = _current_streamer.get()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with streamer_context(streamer):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _stamp_streamer(record):
+    # 必须在产生记录的线程中调用；QueueListener 的写日志线程里 contextvar 没有意义
+    if not hasattr(record, 'streamer'):
+        record.streamer = _current_streamer.get()
+    return record.streamer
+
+
+class _StreamerStamp(logging.Filter):
+    def filter(self, record):
+        _stamp_streamer(record)
+        return True
+
+
+class StreamerFilter(logging.Filter):
+    """只放行属于指定主播的记录，多个主播同时上传时各自的日志文件互不混杂"""
+
+    def __init__(self, streamer):
+        super().__init__()
+        self.streamer = streamer
+
+    def filter(self, record):
+        return _stamp_streamer(record) == self.streamer
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出为一行 JSON，附带 RECORD_FIELDS 中出现的结构化字段"""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for field in RECORD_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _gzip_rotator(source, dest):
+    """轮转时把旧日志压缩为 .gz（在后台监听线程中执行，不阻塞上传）"""
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def create_file_handler(log_file_path, logging_cfg=None, formatter=None):
+    """按配置创建文件日志处理器: 按大小或按时间轮转，旧日志可压缩；rotate: none 时每次运行覆盖"""
+    logging_cfg = logging_cfg or {}
+    log_file_path = Path(log_file_path)
+    log_file_path.parent.mkdir(parents=True, exist_ok=True)
+    rotate = str(logging_cfg.get('rotate', 'size')).lower()
+    backup_count = int(logging_cfg.get('backup_count', DEFAULT_BACKUP_COUNT))
+    if rotate == 'time':
+        handler = TimedRotatingFileHandler(log_file_path, when=logging_cfg.get('when', DEFAULT_ROTATE_WHEN),
+                                           backupCount=backup_count, encoding='utf-8')
+    elif rotate == 'size':
+        handler = RotatingFileHandler(log_file_path, maxBytes=int(float(logging_cfg.get('max_mb', DEFAULT_MAX_MB)) * 1024 * 1024),
+                                      backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8')
+    if rotate in ('size', 'time') and logging_cfg.get('compress', True):
+        handler.namer = lambda name: name + '.gz'
+        handler.rotator = _gzip_rotator
+    handler.setFormatter(formatter or logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def setup_logging(log_file_path, logging_cfg=None):
+    """配置日志系统: 业务线程只把记录放入队列，由后台 QueueListener 写文件与控制台。
+
+    logging_cfg 对应 config.yaml 的 logging 部分:
+      rotate: size | time | none（默认 size）, max_mb, backup_count, when, compress
+      json_file: 额外以 JSON Lines 格式写入的文件（包含 session/parts/part/bytes/elapsed 等字段）
+    """
+    global _listener
+    logging_cfg = logging_cfg or {}
+    handlers = [create_file_handler(log_file_path, logging_cfg)]
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers.append(console)
+    if logging_cfg.get('json_file'):
+        handlers.append(create_file_handler(logging_cfg['json_file'], logging_cfg, JsonFormatter()))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(_StreamerStamp())
+    root.addHandler(queue_handler)
+    if _listener:
+        _listener.stop()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # 进程退出前把队列中剩余的记录写完
+    atexit.register(stop_logging)
+    logging.info(f"日志系统初始化完成，日志将记录到: {log_file_path}")
+
+
+def stop_logging():
+    """停止后台写日志线程并写完队列中的记录"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def add_handler(handler):
+    """在运行中追加一个输出目标（例如 ts.py 调用上传流程时的 upload.log）"""
+    if _listener:
+        _listener.handlers = _listener.handlers + (handler,)
+    else:
+        logging.getLogger().addHandler(handler)
+
+
+def remove_handler(handler):
+    if _listener and handler in _listener.handlers:
+        _listener.handlers = tuple(h for h in _listener.handlers if h is not handler)
+    else:
+        logging.getLogger().removeHandler(handler)
+    handler.close()
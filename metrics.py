@@ -0,0 +1,96 @@
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+# 每次上传运行记录的阶段名称（也是 log.py /metrics 中 stage 标签的取值）
+STAGES = ('scan', 'metadata', 'cover', 'upload', 'cleanup', 'restart')
+
+
+class RunMetrics:
+    """一次上传运行的阶段耗时与上传统计。
+
+    stage() 记录一个阶段的耗时，同一阶段可记录多次（例如每个会话生成一次封面、
+    每次尝试调用一次 upload_by_app）；record_session() 记录一个投稿会话的分段数、
+    字节数、重试次数与实际速率。save() 把整次运行作为一行 JSON 追加到 metrics.jsonl，
+    供 log.py 的 /metrics 与趋势页读取。多个会话并行上传时可在不同线程中调用。
+    """
+
+    def __init__(self, streamer=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.streamer = streamer or ''
+        self.started_at = datetime.now()
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.sessions = []
+        # 成功会话的上传耗时（未取整），用于计算整次运行的平均速率
+        self._upload_seconds = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.monotonic() - started)
+
+    def record_stage(self, name, seconds):
+        with self._lock:
+            self.stages.setdefault(name, []).append(round(seconds, 4))
+
+    def record_session(self, name, parts, total_bytes, seconds, retries, ok, line=None):
+        mbps = total_bytes / 1024 / 1024 / seconds if ok and seconds > 0 else 0.0
+        with self._lock:
+            if ok:
+                self._upload_seconds += seconds
+            self.sessions.append({
+                'name': name, 'parts': parts, 'bytes': total_bytes, 'seconds': round(seconds, 3),
+                'retries': retries, 'ok': bool(ok), 'mbps': round(mbps, 3), 'line': line,
+            })
+
+    def to_dict(self, exit_code=None):
+        with self._lock:
+            sessions = list(self.sessions)
+            stages = {name: list(values) for name, values in self.stages.items()}
+            upload_seconds = self._upload_seconds
+        uploaded = [s for s in sessions if s['ok']]
+        uploaded_bytes = sum(s['bytes'] for s in uploaded)
+        return {
+            'run_id': self.run_id,
+            'started': self.started_at.isoformat(timespec='seconds'),
+            'streamer': self.streamer,
+            'exit_code': exit_code,
+            'duration': round(time.monotonic() - self._started, 3),
+            'stages': stages,
+            'sessions': sessions,
+            'parts': sum(s['parts'] for s in uploaded),
+            'bytes': uploaded_bytes,
+            'retries': sum(s['retries'] for s in sessions),
+            'mbps': round(uploaded_bytes / 1024 / 1024 / upload_seconds, 3) if upload_seconds > 0 else 0.0,
+        }
+
+    def summary(self):
+        """日志中输出的一行阶段耗时摘要"""
+        with self._lock:
+            parts = [f"{name} {sum(values):.1f}s" for name, values in self.stages.items()]
+        return ', '.join(parts)
+
+    def save(self, path, exit_code=None):
+        """把本次运行追加写入 metrics.jsonl；写入失败只记录警告，不影响上传结果"""
+        path = Path(path)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            line = json.dumps(self.to_dict(exit_code), ensure_ascii=False) + '\n'
+            # 一次 write 写入整行，多个主播同时结束时行之间不会交错
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logging.warning(f"保存运行统计失败: {e}")
@@ -0,0 +1,47 @@
+from pathlib import Path
+import logging
+import re
+
+# 录制文件命名: 标题_日期[_时间]_序号，例如 小枫灬游戏解说_2025-08-25_07-10-33_000.ts
+SESSION_NAME_RE = re.compile(
+    r'^(?P<title>.+?)_(?P<date>\d{4}-\d{2}-\d{2})(?:_(?P<time>\d{2}-\d{2}-\d{2}))?_(?P<index>\d+)$')
+
+
+def parse_video_name(path):
+    """解析文件名，返回 (标题, 日期, 时间, 序号)；不符合命名规范返回 None"""
+    match = SESSION_NAME_RE.match(Path(path).stem)
+    if not match:
+        return None
+    return match.group('title'), match.group('date'), match.group('time') or '', int(match.group('index'))
+
+
+def plan_sessions(video_paths):
+    """按 '标题_日期_序号' 把视频分组为独立的投稿会话。
+
+    同一标题、日期（及录制开始时间）的分段属于同一场直播，组内按序号排序；
+    不符合命名规范的文件合并为一个使用默认标题的会话。
+    返回会话列表，每个会话为 dict: name / title / date / parts。
+    """
+    groups, unmatched = {}, []
+    for path in video_paths:
+        parsed = parse_video_name(path)
+        if parsed is None:
+            unmatched.append(path)
+            continue
+        title, date, start_time, index = parsed
+        groups.setdefault((date, start_time, title), []).append((index, path))
+
+    sessions = []
+    for (date, start_time, title), parts in sorted(groups.items()):
+        parts.sort(key=lambda item: item[0])
+        name = '_'.join(p for p in (title, date, start_time) if p)
+        sessions.append({'name': name, 'title': title, 'date': date, 'parts': [p for _, p in parts]})
+
+    if unmatched:
+        logging.warning(f"{len(unmatched)} 个文件不符合 '标题_日期_序号' 命名规范，将合并为一个使用默认标题的投稿。")
+        sessions.append({'name': '默认标题', 'title': '', 'date': '', 'parts': sorted(unmatched)})
+
+    logging.info(f"共规划出 {len(sessions)} 个投稿会话:")
+    for session in sessions:
+        logging.info(f"  => {session['name']}: {len(session['parts'])} 个分段")
+    return sessions
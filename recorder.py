@@ -0,0 +1,177 @@
+from pathlib import Path
+import json
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+# 请求录制软件正常退出后等待的秒数，超时再强制结束
+DEFAULT_GRACEFUL_TIMEOUT = 10
+DEFAULT_KILL_TIMEOUT = 5
+
+# 多个主播的上传可能同时结束，同一时间只允许一次重启
+_restart_lock = threading.Lock()
+
+
+class RecorderSupervisor:
+    """管理录制软件进程: 记录启动时的 PID，需要重启时按 PID 找到进程，
+    先请求正常退出，用 psutil.wait_procs 等到进程（及其子进程，如 ffmpeg）
+    真正退出后立即重新启动，并记录录制中断的时长。
+
+    Windows 上启动 paths.recorder_exe_path（新控制台窗口）；其他系统或配置了
+    recorder.command 时执行该命令。PID 与进程创建时间保存在 pid_file 中，
+    防止 PID 被系统复用后误杀其他进程；没有记录时才按进程名查找一次。
+    只配置了 recorder.command、既没有 PID 记录也没有 process_name 时无法判断录制软件
+    是否已在运行，此时不启动，避免同时运行两个录制软件。
+    """
+
+    def __init__(self, config, script_dir):
+        paths_cfg = config.get('paths', {})
+        recorder_cfg = config.get('recorder') or {}
+        self.process_name = recorder_cfg.get('process_name')
+        self.exe_path = paths_cfg.get('recorder_exe_path')
+        self.command = recorder_cfg.get('command')
+        self.cwd = recorder_cfg.get('cwd')
+        self.graceful_timeout = float(recorder_cfg.get('graceful_timeout', DEFAULT_GRACEFUL_TIMEOUT))
+        self.kill_timeout = float(recorder_cfg.get('kill_timeout', DEFAULT_KILL_TIMEOUT))
+        self.pid_file = Path(recorder_cfg.get('pid_file') or Path(script_dir) / "recorder.pid")
+
+    @property
+    def configured(self):
+        return bool(self.command or (self.process_name and self.exe_path))
+
+    def _launch_args(self):
+        """返回 (启动参数列表, 工作目录)"""
+        if self.command:
+            args = shlex.split(self.command, posix=os.name != 'nt') if isinstance(self.command, str) else list(self.command)
+            return args, self.cwd
+        return [self.exe_path], self.cwd or str(Path(self.exe_path).parent)
+
+    def _tracked_process(self):
+        """按 pid_file 中记录的 PID 找到录制进程，记录无效时返回 None"""
+        import psutil
+        try:
+            with open(self.pid_file, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            proc = psutil.Process(record['pid'])
+            if abs(proc.create_time() - record['create_time']) > 1:
+                return None
+            return proc
+        except (OSError, ValueError, KeyError, psutil.Error):
+            return None
+
+    def _has_pid_record(self):
+        """pid_file 中是否有本程序启动录制软件时留下的记录（进程可能已经退出）"""
+        try:
+            with open(self.pid_file, 'r', encoding='utf-8') as f:
+                return 'pid' in json.load(f)
+        except (OSError, ValueError, TypeError):
+            return False
+
+    def find(self):
+        """返回正在运行的录制进程列表"""
+        import psutil
+        proc = self._tracked_process()
+        if proc is not None:
+            return [proc]
+        if not self.process_name:
+            return []
+        # 没有 PID 记录（例如录制软件是手动启动的）: 只按进程名扫描一次
+        return [p for p in psutil.process_iter(['name']) if p.info['name'] == self.process_name]
+
+    def stop(self, procs):
+        """请求进程正常退出，超时后强制结束；返回进程全部退出的时刻（monotonic）"""
+        import psutil
+        targets = list(procs)
+        for proc in procs:
+            try:
+                targets.extend(proc.children(recursive=True))
+            except psutil.Error:
+                pass
+        requested = False
+        for proc in procs:
+            try:
+                if os.name == 'nt':
+                    # 不带 /f 的 taskkill 发送关闭请求，让录制软件有机会写完文件尾；
+                    # 没有窗口的控制台程序会拒绝该请求，此时直接强制结束
+                    result = subprocess.run(['taskkill', '/pid', str(proc.pid), '/t'],
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    requested = requested or result.returncode == 0
+                else:
+                    proc.terminate()
+                    requested = True
+            except (OSError, psutil.Error) as e:
+                logging.warning(f"请求录制软件 (PID {proc.pid}) 退出失败: {e}")
+
+        _, alive = psutil.wait_procs(targets, timeout=self.graceful_timeout if requested else 0)
+        if alive:
+            if requested:
+                logging.warning(f"录制软件 {self.graceful_timeout:.0f} 秒内未退出，强制结束 {len(alive)} 个进程。")
+            for proc in alive:
+                try:
+                    proc.kill()
+                except psutil.Error:
+                    pass
+            _, alive = psutil.wait_procs(alive, timeout=self.kill_timeout)
+            if alive:
+                logging.error(f"仍有 {len(alive)} 个录制进程未能结束: {[p.pid for p in alive]}")
+        return time.monotonic()
+
+    def start(self):
+        """启动录制软件并记录其 PID，返回进程对象；启动失败返回 None"""
+        import psutil
+        args, cwd = self._launch_args()
+        if not self.command and not Path(self.exe_path).exists():
+            logging.error(f"配置文件中指定的路径不存在: '{self.exe_path}'，无法重启。")
+            return None
+        kwargs = {'cwd': cwd}
+        if sys.platform == 'win32':
+            # 与原来的 "start" 一样在新的控制台窗口中运行，但能直接拿到进程 PID
+            kwargs['creationflags'] = subprocess.CREATE_NEW_CONSOLE
+        else:
+            # 脱离当前会话，上传程序退出后录制软件继续运行
+            kwargs['start_new_session'] = True
+            kwargs['stdout'] = kwargs['stderr'] = subprocess.DEVNULL
+        try:
+            popen = subprocess.Popen(args, **kwargs)
+            proc = psutil.Process(popen.pid)
+            record = {'pid': proc.pid, 'create_time': proc.create_time(), 'args': args}
+        except (OSError, psutil.Error) as e:
+            logging.error(f"启动录制软件失败 ({args}): {e}")
+            return None
+        try:
+            with open(self.pid_file, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+        except OSError as e:
+            logging.warning(f"保存录制软件 PID 失败: {e}")
+        return proc
+
+    def restart(self):
+        """重启录制软件，返回录制中断的秒数（未能启动时返回 None）"""
+        if not self.configured:
+            logging.info("配置文件中未提供 'recorder' 设置或 'recorder_exe_path'，跳过重启录制软件的步骤。")
+            return None
+        with _restart_lock:
+            name = self.process_name or Path(self._launch_args()[0][0]).name
+            started = time.monotonic()
+            procs = self.find()
+            if not procs and not self.process_name and not self._has_pid_record():
+                logging.error(f"无法确认 {name} 是否已在运行: 没有 PID 记录 ({self.pid_file})，也未配置 "
+                              f"recorder.process_name。为避免启动第二个录制软件，跳过重启。")
+                return None
+            if procs:
+                logging.info(f"检测到 {name} 正在运行 (PID {', '.join(str(p.pid) for p in procs)})，现在关闭它...")
+                exited = self.stop(procs)
+                logging.info(f"{name} 已关闭，用时 {exited - started:.1f} 秒。")
+            else:
+                logging.info(f"未检测到 {name} 运行。")
+
+            proc = self.start()
+            if proc is None:
+                return None
+            downtime = time.monotonic() - started
+            logging.info(f"{name} 已重启 (PID {proc.pid})，录制中断 {downtime:.1f} 秒。")
+            return downtime
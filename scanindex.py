@@ -0,0 +1,92 @@
+from pathlib import Path
+import json
+import logging
+import os
+import re
+import threading
+
+VIDEO_SUFFIXES = ('.ts', '.mp4', '.flv')
+
+_DIGITS_RE = re.compile(r'(\d+)')
+
+
+def natural_key(name):
+    """自然排序键: 数字部分按数值比较，例如 x_9 排在 x_10 之前"""
+    parts = _DIGITS_RE.split(name.lower())
+    # split 的结果奇数位总是数字，偶数位总是文本，比较时类型一一对应
+    return [int(p) if i % 2 else p for i, p in enumerate(parts)]
+
+
+class DirectoryIndex:
+    """录制目录的增量索引，只用一次 os.scandir 列出视频文件。
+
+    每个文件记录大小、修改时间、预先计算的排序键和是否已通过完整性检查，
+    按目录保存到 JSON 快照。下次扫描时大小与修改时间都没变的文件直接沿用
+    上次的结果，只有新增或变化的文件需要重新检查。snapshot_path 为 None 时
+    不读写快照（仅做单次扫描）。
+    """
+
+    def __init__(self, snapshot_path=None):
+        self.path = Path(snapshot_path) if snapshot_path else None
+        # 目录 -> {文件名: {'size', 'mtime', 'key', 'checked'}}
+        self.folders = {}
+        # 多主播常驻模式下多个目录可能同时扫描并保存同一个快照
+        self._lock = threading.Lock()
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.folders = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"目录快照无法读取，将重新扫描: {e}")
+
+    def scan(self, video_folder):
+        """扫描目录，返回 (排好序的视频路径, 新增或变化的路径)"""
+        video_folder = Path(video_folder)
+        old = self.folders.get(str(video_folder), {})
+        entries, changed = {}, []
+        with os.scandir(video_folder) as it:
+            for entry in it:
+                if not entry.name.lower().endswith(VIDEO_SUFFIXES) or not entry.is_file():
+                    continue
+                # Windows 上 scandir 的 stat 结果来自目录列表本身，不需要逐个文件再请求
+                st = entry.stat()
+                record = old.get(entry.name)
+                if record is None or (record['size'], record['mtime']) != (st.st_size, st.st_mtime_ns):
+                    record = {'size': st.st_size, 'mtime': st.st_mtime_ns,
+                              'key': natural_key(entry.name), 'checked': False}
+                    changed.append(video_folder / entry.name)
+                entries[entry.name] = record
+        with self._lock:
+            self.folders[str(video_folder)] = entries
+        names = sorted(entries, key=lambda name: entries[name]['key'])
+        changed.sort(key=lambda p: entries[p.name]['key'])
+        return [video_folder / name for name in names], changed
+
+    def is_checked(self, path):
+        record = self.folders.get(str(Path(path).parent), {}).get(Path(path).name)
+        return bool(record and record['checked'])
+
+    def mark_checked(self, paths):
+        """记录这些文件已通过完整性检查（检查时可能裁剪过文件，按当前状态更新）"""
+        for path in paths:
+            path = Path(path)
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            with self._lock:
+                record = self.folders.get(str(path.parent), {}).get(path.name)
+                if record is not None:
+                    record.update(size=st.st_size, mtime=st.st_mtime_ns, checked=True)
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with self._lock:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.folders, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"保存目录快照失败: {e}")
@@ -0,0 +1,332 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+from logsetup import streamer_context
+from watcher import SegmentWatcher
+
+DEFAULT_HEARTBEAT = 300
+DEFAULT_IPC_PORT = 47821
+# 单次 IPC 请求的最大长度
+IPC_MAX_BYTES = 256
+# 向前查找下一次触发时间的最多天数（如 "0 0 29 2 *" 需要跨年）
+MAX_LOOKAHEAD_DAYS = 366 * 5
+# 主循环晚于计划时间超过该秒数（电脑睡眠或挂起后醒来）视为错过了这次定时
+MISSED_GRACE_SECONDS = 60
+
+_FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_field(text, low, high):
+    """解析 cron 的一个字段，支持 *、*/n、a-b、a-b/n 与逗号列表"""
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"步长必须为正数: {text}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(x) for x in part.split('-', 1))
+        else:
+            start = end = int(part)
+            if step > 1:
+                end = high
+        if not (low <= start <= end <= high):
+            raise ValueError(f"取值超出范围 {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronTrigger:
+    """五段式 cron 表达式（分 时 日 月 周），也接受 "HH:MM" 表示每天该时间。
+
+    与标准 cron 相同: 日与周都被限制时，满足其一即触发；周日可写作 0 或 7。
+    """
+
+    def __init__(self, expr):
+        self.expr = expr.strip()
+        if ':' in self.expr and ' ' not in self.expr:
+            hour, minute = self.expr.split(':', 1)
+            fields = [minute, hour, '*', '*', '*']
+        else:
+            fields = self.expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式必须为 5 段 (分 时 日 月 周): '{expr}'")
+        minutes, hours, days, months, weekdays = (
+            _parse_field(f, low, high) for f, (low, high) in zip(fields, _FIELD_RANGES))
+        self.minutes, self.hours = sorted(minutes), sorted(hours)
+        self.days, self.months = days, months
+        self.weekdays = {d % 7 for d in weekdays}
+        self.day_any, self.weekday_any = fields[2] == '*', fields[4] == '*'
+
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self.day_any or self.weekday_any:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, when):
+        """返回严格晚于 when 的下一次触发时间（精确到分钟）"""
+        start = when.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(MAX_LOOKAHEAD_DAYS):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"cron 表达式永远不会触发: '{self.expr}'")
+
+    def __repr__(self):
+        return f"CronTrigger('{self.expr}')"
+
+
+class _Job:
+    def __init__(self, name, func, triggers, catch_up, jitter_seconds):
+        self.name = name
+        self.func = func
+        self.triggers = triggers
+        self.catch_up = catch_up
+        self.jitter_seconds = jitter_seconds
+        # 计算下一次定时触发的基准时间（上次执行时间）
+        self.last_run = None
+        self.next_due = None
+        self.requested = None
+        self.running = False
+
+
+class Scheduler:
+    """常驻调度器: 每个任务可有多个 cron 触发器，另可被事件立即唤醒。
+
+      - 错过的定时（例如电脑在该时间处于睡眠）: catch_up 时醒来后立即补跑一次
+        （多次错过只补一次），否则跳到下一个触发时间
+      - 每次定时执行在触发时间之后再随机延迟 0~jitter_seconds 秒，
+        避免多个任务同时开始抢占带宽
+      - 同一任务不会重叠执行: 运行中再次触发只记一次，结束后立即再跑一次
+    上次执行时间保存在 state_path，重启后仍能判断是否错过了定时。
+    """
+
+    def __init__(self, state_path=None, max_workers=1, heartbeat=DEFAULT_HEARTBEAT):
+        self.state_path = Path(state_path) if state_path else None
+        self.heartbeat = heartbeat
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='job')
+        self._state = {}
+        if self.state_path and self.state_path.exists():
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    self._state = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"[调度] 调度状态无法读取，将从现在开始计时: {e}")
+
+    def add_job(self, name, func, triggers, catch_up=True, jitter_seconds=0):
+        """注册任务；triggers 为 cron 表达式或 "HH:MM" 字符串列表。
+
+        表达式无法解析或永远不会触发（例如 "0 0 30 2 *"）时抛出 ValueError，在启动时而不是主循环中报错。
+        """
+        job = _Job(name, func, [CronTrigger(t) for t in triggers], catch_up, float(jitter_seconds))
+        now = datetime.now()
+        for trigger in job.triggers:
+            trigger.next_after(now)
+        last_run = self._state.get(name)
+        if last_run:
+            try:
+                job.last_run = datetime.fromisoformat(last_run)
+            except ValueError:
+                pass
+        self.jobs[name] = job
+        logging.info(f"[调度] 已注册任务 '{name}': {', '.join(t.expr for t in job.triggers) or '仅事件触发'}")
+        return job
+
+    def trigger(self, name=None, reason='手动'):
+        """立即执行指定任务（name 为 None 时执行全部任务），可在任意线程调用"""
+        with self._lock:
+            targets = [self.jobs[name]] if name in self.jobs else list(self.jobs.values()) if name is None else []
+            for job in targets:
+                job.requested = job.requested or reason
+        if not targets:
+            logging.warning(f"[调度] 未知任务: '{name}'")
+            return False
+        self._wake.set()
+        return True
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _plan(self, job, now, base=None):
+        """计算任务下一次定时执行的时间（已加入随机延迟），没有触发器时返回 None"""
+        if not job.triggers:
+            return None
+        base = base or job.last_run or now
+        due = min(t.next_after(base) for t in job.triggers)
+        if due < now:
+            if job.catch_up:
+                logging.info(f"[调度] 任务 '{job.name}' 错过了 {due:%Y-%m-%d %H:%M} 的定时执行，立即补跑")
+                return now
+            logging.info(f"[调度] 任务 '{job.name}' 错过了 {due:%Y-%m-%d %H:%M} 的定时执行，已跳过")
+            due = min(t.next_after(now) for t in job.triggers)
+        if job.jitter_seconds:
+            due += timedelta(seconds=random.uniform(0, job.jitter_seconds))
+        logging.info(f"[调度] 任务 '{job.name}' 下次执行时间: {due:%Y-%m-%d %H:%M:%S}")
+        return due
+
+    def _start(self, job, reason):
+        job.running = True
+        job.requested = None
+        job.last_run = datetime.now()
+        self._pool.submit(self._run_job, job, reason)
+
+    def _run_job(self, job, reason):
+        started = time.monotonic()
+        logging.info(f"[调度] 开始执行任务 '{job.name}' ({reason})")
+        try:
+            # 任务名即主播名，任务中产生的日志都标记为属于该主播
+            with streamer_context(job.name):
+                job.func()
+        except SystemExit as e:
+            logging.info(f"[调度] 任务 '{job.name}' 以退出码 {e.code} 结束")
+        except Exception as e:
+            logging.exception(f"[调度] 任务 '{job.name}' 执行异常: {e}")
+        finally:
+            logging.info(f"[调度] 任务 '{job.name}' 执行结束, 耗时 {time.monotonic() - started:.1f}s")
+            with self._lock:
+                job.running = False
+                self._save_state()
+            self._wake.set()
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        state = {name: job.last_run.isoformat() for name, job in self.jobs.items() if job.last_run}
+        tmp_path = self.state_path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logging.warning(f"[调度] 保存调度状态失败: {e}")
+
+    def run_forever(self):
+        """调度主循环，直到 stop() 被调用"""
+        last_heartbeat = time.monotonic()
+        try:
+            while not self._stopped:
+                self._wake.clear()
+                now = datetime.now()
+                with self._lock:
+                    for job in self.jobs.values():
+                        if job.next_due is None:
+                            job.next_due = self._plan(job, now)
+                        if (job.next_due is not None and not job.catch_up
+                                and (now - job.next_due).total_seconds() > MISSED_GRACE_SECONDS):
+                            # 睡眠醒来时早先算好的时间已经过去；不补跑时从现在起重新计算
+                            logging.info(f"[调度] 任务 '{job.name}' 错过了 {job.next_due:%Y-%m-%d %H:%M} 的定时执行，已跳过")
+                            job.next_due = self._plan(job, now, base=now)
+                        if job.next_due is not None and now >= job.next_due:
+                            # 任务仍在运行时只记下请求，从现在起计算下一次定时
+                            job.requested = job.requested or '定时'
+                            job.last_run = now
+                            job.next_due = None
+                        if job.requested and not job.running:
+                            self._start(job, job.requested)
+                            job.next_due = None
+                    dues = [job.next_due for job in self.jobs.values() if job.next_due is not None]
+
+                if time.monotonic() - last_heartbeat >= self.heartbeat:
+                    last_heartbeat = time.monotonic()
+                    if dues:
+                        logging.info(f"[调度] 仍在等待: 距下次定时执行 {(min(dues) - now).total_seconds() / 60:.1f} 分钟")
+                # 按墙钟时间计算等待；电脑睡眠后醒来最多一个心跳周期内就能发现错过的定时
+                timeout = self.heartbeat
+                if dues:
+                    timeout = max(0.0, min(timeout, (min(dues) - now).total_seconds()))
+                self._wake.wait(timeout)
+        finally:
+            self._pool.shutdown(wait=True)
+
+
+class FolderTrigger:
+    """监视录制目录，一场直播结束（最后一个分段静止一段时间）时立即唤醒调度器执行任务"""
+
+    def __init__(self, scheduler, job_name, video_folder, poll_interval=10,
+                 settle_seconds=30, stream_end_seconds=180):
+        self.scheduler = scheduler
+        self.job_name = job_name
+        self.poll_interval = poll_interval
+        self.watcher = SegmentWatcher(video_folder, settle_seconds, stream_end_seconds)
+        self._thread = threading.Thread(target=self._run, name=f'folder-{job_name}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                _, ended = self.watcher.poll()
+                for name in ended:
+                    self.scheduler.trigger(self.job_name, f'直播结束: {name}')
+            except Exception:
+                # 录制目录暂时不可访问等错误不能结束监视线程，下一轮继续
+                logging.exception(f"[调度] 监视 '{self.job_name}' 的录制目录时出错")
+            time.sleep(self.poll_interval)
+
+
+class IpcTrigger:
+    """本机 TCP 端口上的触发接口，录制软件的"直播结束"脚本可以用 send_trigger 立即唤醒调度器。
+
+    协议为一行文本: "run" 执行全部任务，"run <任务名>" 执行指定任务。只监听 127.0.0.1。
+    """
+
+    def __init__(self, scheduler, port=DEFAULT_IPC_PORT, host='127.0.0.1'):
+        self.scheduler = scheduler
+        self.sock = socket.create_server((host, port))
+        self._thread = threading.Thread(target=self._serve, name='ipc-trigger', daemon=True)
+
+    def start(self):
+        logging.info(f"[调度] 触发接口监听于 {self.sock.getsockname()[0]}:{self.sock.getsockname()[1]}")
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                conn.settimeout(5)
+                try:
+                    command = conn.recv(IPC_MAX_BYTES).decode('utf-8', 'replace').strip().split(maxsplit=1)
+                    if command and command[0] == 'run':
+                        ok = self.scheduler.trigger(command[1] if len(command) > 1 else None, 'IPC 触发')
+                        conn.sendall(b'ok\n' if ok else b'unknown job\n')
+                    else:
+                        conn.sendall(b'unknown command\n')
+                except OSError as e:
+                    logging.warning(f"[调度] 处理触发请求失败: {e}")
+
+
+def send_trigger(name=None, port=DEFAULT_IPC_PORT, host='127.0.0.1', timeout=5):
+    """通知正在运行的调度器立即执行任务，返回调度器的回复"""
+    with socket.create_connection((host, port), timeout=timeout) as conn:
+        conn.sendall(f"run {name}\n".encode('utf-8') if name else b"run\n")
+        return conn.recv(IPC_MAX_BYTES).decode('utf-8', 'replace').strip()
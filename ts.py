@@ -1,16 +1,27 @@
-import stream_gears
 from pathlib import Path
 import sys
-import json
 import logging
 import yaml
-from PIL import Image, ImageDraw, ImageFont
-from datetime import datetime, timedelta
-import os
 import time
-import subprocess
-import psutil
 import argparse
+import copy
+import functools
+import multiprocessing
+import re
+from scanindex import DirectoryIndex
+from planner import parse_video_name
+from logsetup import setup_logging, streamer_context
+from scheduler import Scheduler, FolderTrigger, IpcTrigger, send_trigger, DEFAULT_HEARTBEAT, DEFAULT_IPC_PORT
+
+# 常驻模式的默认每日执行时间与任务名
+DEFAULT_DAILY_TIME = '03:00'
+UPLOAD_JOB = 'upload'
+# streamers 条目中的简写键 -> 所属的配置段
+STREAMER_KEYS = {
+    'video_folder': 'paths', 'cookies_file': 'paths', 'name': 'paths', 'name_pattern': 'paths', 'log_file': 'paths',
+    'tid': 'upload', 'tag': 'upload', 'source': 'upload', 'desc': 'upload',
+    'triggers': 'schedule',
+}
 
 # --- 功能函数 ---
 
@@ -28,7 +39,8 @@ def load_config(config_path):
             return None
     
     paths_cfg = config.get('paths', {})
-    required_paths = ['video_folder', 'log_file1']
+    # 配置了 streamers 时录制目录由每个主播各自指定
+    required_paths = ['log_file1'] if config.get('streamers') else ['video_folder', 'log_file1']
     for key in required_paths:
         if key not in paths_cfg:
             print(f"配置文件 'config.yaml' 的 'paths' 部分缺少设置: '{key}'")
@@ -36,84 +48,129 @@ def load_config(config_path):
             
     return config
 
-def setup_logging(log_file_path):
-    """配置日志系统"""
-    log_file_path.parent.mkdir(parents=True, exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file_path, mode='w', encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    logging.info(f"日志系统初始化完成，日志将记录到: {log_file_path}")
-
 def get_sorted_videos(video_folder):
     """扫描并排序视频文件"""
     logging.info(f"正在扫描文件夹: {video_folder}")
     logging.info(f"完整绝对路径为: {video_folder.resolve()}")
-    video_paths = list(video_folder.glob('*.ts')) + list(video_folder.glob('*.mp4')) + list(video_folder.glob('*.flv'))
+    try:
+        video_paths, _ = DirectoryIndex().scan(video_folder)
+    except OSError as e:
+        logging.error(f"扫描文件夹失败: {e}")
+        return []
 
     if not video_paths:
         logging.info("未找到需要的视频文件，程序退出。")
         return []
     return video_paths
 
-def extract_metadata(video_paths):
-    """从文件名解析标题和日期"""
-    title, date = "默认标题", ""
-    first_part_video = next((p for p in video_paths if p.stem.endswith('_000')), None)
-
-    if first_part_video:
-        logging.info(f"找到起始视频: {first_part_video.name}，将从中解析标题和日期。")
-        try:
-            parts = first_part_video.stem.split('_')
-            if len(parts) >= 2:
-                title, date = parts[0], parts[1]
-                logging.info(f"成功解析 -> 标题: '{title}', 日期: '{date}'")
-            else:
-                logging.warning("文件名格式不符合 '标题_日期_...' 规范，将使用默认标题。")
-        except (ValueError, IndexError) as e:
-            logging.error(f"解析文件名时出错: {e}，将使用默认标题。")
-    else:
-        logging.warning("未找到以 '_000' 结尾的视频，将使用默认标题。")
-    return title, date
-
 # --- 主程序 ---
-def main():
-    # 1. 确定根目录 (兼容PyInstaller)
+def get_script_dir():
+    """确定根目录 (兼容PyInstaller)"""
     if getattr(sys, 'frozen', False):
         # 如果是打包后的 .exe 文件，根目录是 .exe 文件所在的目录
-        script_dir = Path(sys.executable).parent
+        return Path(sys.executable).parent
+    # 如果是普通的 .py 脚本，根目录是脚本文件所在的目录
+    return Path(__file__).resolve().parent
 
-    else:
-        # 如果是普通的 .py 脚本，根目录是脚本文件所在的目录
-        script_dir = Path(__file__).resolve().parent
+def build_streamer_configs(config):
+    """按 streamers 列表为每个主播生成完整配置，返回 [(任务名, 配置)]。
+
+    每个主播条目中的简写键覆盖对应设置:
+      video_folder / cookies_file / name / name_pattern / log_file -> paths
+      tid / tag / source / desc -> upload，only_self -> 顶层 only_self
+      triggers -> schedule
+    条目中与顶层同名的配置段（如 recorder、behavior）按键合并。
+    每个主播的 paths.streamer_folders 为所有主播的录制目录。
+    未配置 streamers 时只有顶层配置这一个主播。
+    """
+    profiles = config.get('streamers')
+    if not profiles:
+        return [(config.get('paths', {}).get('name') or UPLOAD_JOB, config)]
+
+    configs = []
+    for index, profile in enumerate(profiles):
+        cfg = copy.deepcopy({k: v for k, v in config.items() if k != 'streamers'})
+        for key, value in profile.items():
+            section = STREAMER_KEYS.get(key)
+            if key == 'only_self':
+                # 顶层 only_self 优先于 upload.only_self，直接覆盖顶层
+                cfg['only_self'] = value
+            elif section:
+                cfg.setdefault(section, {})[key] = value
+            elif isinstance(value, dict):
+                cfg.setdefault(key, {}).update(value)
+        paths_cfg = cfg.setdefault('paths', {})
+        name = profile.get('name') or f"streamer{index + 1}"
+        if 'log_file' not in profile and 'log_file' in paths_cfg:
+            # 多个主播可能同时上传，默认各自写一个上传日志
+            log_file = Path(paths_cfg['log_file'])
+            paths_cfg['log_file'] = str(log_file.with_name(f"{log_file.stem}_{name}{log_file.suffix}"))
+        if 'video_folder' not in paths_cfg:
+            logging.error(f"主播 '{name}' 未设置 video_folder，已忽略。")
+            continue
+        configs.append((name, cfg))
+    # 录制软件由所有主播共用，重启前要确认其他主播都没有在录制（见 up.upload_pipeline）
+    folders = [cfg['paths']['video_folder'] for _, cfg in configs]
+    for _, cfg in configs:
+        cfg['paths']['streamer_folders'] = folders
+    return configs
+
+def title_matches(title, paths_cfg):
+    """文件标题是否属于该主播: 优先按 name_pattern 正则整体匹配，否则与 name 比较"""
+    pattern = paths_cfg.get('name_pattern')
+    if pattern:
+        return re.fullmatch(pattern, title) is not None
+    return title == paths_cfg.get('name')
+
+def run_streamer(config, shared=None):
+    """检查一个主播的录制目录，标题匹配时执行上传流程，返回退出码"""
+    paths_cfg = config.get('paths', {})
+    video_paths = get_sorted_videos(Path(paths_cfg['video_folder']))
+    if not video_paths:
+        return 0
+
+    # 与 up.py 使用同一套文件名解析，保证这里认定的标题就是投稿时的标题
+    titles = sorted({parsed[0] for parsed in map(parse_video_name, video_paths) if parsed})
+    logging.info(f"从文件中提取到的标题: {', '.join(titles) or '无'}")
+    logging.info(f"配置文件中指定的标题: {paths_cfg.get('name_pattern') or paths_cfg.get('name')}")
+    if not any(title_matches(title, paths_cfg) for title in titles):
+        return 0
+
+    logging.info("标题匹配成功")
+    # 直接在本进程中执行上传流程；常驻模式下依赖库只导入一次，不必每次冷启动 up.exe
+    logging.info("上传程序已启动")
+    logging.info("----------------------------------------------------------")
+    started = time.monotonic()
+    try:
+        # 上传流程只在标题匹配时才导入；常驻模式下第一次导入后保持加载
+        import up
+        exit_code = up.run(config, shared)
+    except Exception as e:
+        logging.exception(f"上传程序异常退出: {e}")
+        exit_code = 1
+    logging.info("----------------------------------------------------------")
+    logging.info(f"上传程序已结束，退出码: {exit_code}，耗时 {time.monotonic() - started:.1f}s")
+    return exit_code
+
+def main():
+    # 1. 确定根目录 (兼容PyInstaller)
+    script_dir = get_script_dir()
 
     config = load_config(script_dir / "config.yaml")
     if not config:
         sys.exit(1)
-    paths_cfg = config.get('paths', {})
 
     # setup_logging(Path(paths_cfg['log_file1'])) # 日志已在启动时初始化
     logging.info(f"脚本所在目录: {script_dir}")
 
-    video_paths = get_sorted_videos(Path(paths_cfg['video_folder']))
-    if not video_paths:
-        return
-
-    title_from_file, _ = extract_metadata(video_paths)
-    logging.info(f"从文件中提取到的标题: {title_from_file}")
-    logging.info(f"配置文件中指定的标题: {paths_cfg.get('name')}")
-    if title_from_file == paths_cfg.get('name'):
-        logging.info("标题匹配成功")
-        logging.info(paths_cfg.get('run_path'))
-        logging.info("上传程序已启动")
-        logging.info("----------------------------------------------------------")
-        subprocess.run([paths_cfg.get('run_path')])
-        
-        
+    # 多个主播依次检查，返回其中最差的退出码
+    exit_code = 0
+    for name, streamer_config in build_streamer_configs(config):
+        logging.info(f"检查主播: {name}")
+        with streamer_context(name):
+            exit_code = max(exit_code, run_streamer(streamer_config) or 0)
+    return exit_code
+
 def _parse_time_str(tstr: str):
     """解析 HH:MM 字符串为 (hour, minute)"""
     try:
@@ -128,55 +185,98 @@ def _parse_time_str(tstr: str):
         raise argparse.ArgumentTypeError('时间格式必须为 HH:MM 且合法，例如 03:00')
 
 
-def run_daily(target_h: int, target_m: int):
-    """保持常驻, 每天指定时间执行 main() 一次。
+def run_scheduled(config, times=None):
+    """保持常驻, 按 config.yaml 的 schedule 设置（或命令行 --time）定时检查并上传。
 
-    逻辑:
-      1. 计算下一次执行的目标时间 (今天的 target, 若已过则 +1 天)
-      2. 睡眠到目标时间前, 期间每隔一段输出心跳日志
-      3. 到点后执行 main()
+    streamers 中的每个主播是调度器中的一个任务，各自有触发时间与录制目录监视；
+    所有主播在同一进程中共用连接预算、日志簿等资源（见 up.create_shared_resources），
+    总上传连接数受 upload.max_connections 限制。除定时外，录制目录中一场直播结束
+    或收到 `ts.exe --trigger` 时也会立即执行；同一主播的执行不会重叠。
     """
-    logging.info(f"[调度] 已启动每日定时模式: 每天 {target_h:02d}:{target_m:02d} 执行")
-    while True:
-        now = datetime.now()
-        target = now.replace(hour=target_h, minute=target_m, second=0, microsecond=0)
-        if now >= target:
-            target = target + timedelta(days=1)
-        wait_sec = (target - now).total_seconds()
-        heartbeat = 300  # 心跳间隔秒
-        logging.info(f"[调度] 下次执行时间: {target} (剩余 {wait_sec/3600:.2f} 小时)")
-        slept = 0
-        while slept < wait_sec:
-            slice_sec = min(heartbeat, wait_sec - slept)
-            time.sleep(slice_sec)
-            slept += slice_sec
-            remain = wait_sec - slept
-            if remain > 0:
-                logging.info(f"[调度] 仍在等待: 剩余 {remain/60:.1f} 分钟")
-        start_ts = datetime.now()
-        logging.info(f"[调度] 开始执行 main() @ {start_ts}")
+    import up
+    from budget import BandwidthScheduler
+    from login import get_credential_service
+
+    schedule_cfg = config.get('schedule') or {}
+    watch_cfg = config.get('watch') or {}
+    paths_cfg = config.get('paths', {})
+    script_dir = get_script_dir()
+
+    streamers = build_streamer_configs(config)
+    if not streamers:
+        logging.error("[调度] 没有可用的主播配置。")
+        sys.exit(1)
+    shared = up.create_shared_resources(config, script_dir)
+    bandwidth = BandwidthScheduler(shared['budget'], config.get('bandwidth') or {},
+                                   [cfg['paths']['video_folder'] for _, cfg in streamers])
+    bandwidth.start()
+
+    scheduler = Scheduler(paths_cfg.get('schedule_state') or script_dir / "schedule_state.json",
+                          max_workers=int(schedule_cfg.get('max_concurrent_jobs', len(streamers))),
+                          heartbeat=float(schedule_cfg.get('heartbeat', DEFAULT_HEARTBEAT)))
+    for name, streamer_config in streamers:
+        # 常驻期间在凭据到期前自动续期（多个主播共用同一 cookies 文件时只启动一次）
+        cookies_file = streamer_config['paths'].get('cookies_file')
+        if cookies_file:
+            get_credential_service(cookies_file, streamer_config.get('login')).start()
+        streamer_schedule = streamer_config.get('schedule') or {}
+        triggers = times or streamer_schedule.get('triggers') or [DEFAULT_DAILY_TIME]
+        try:
+            scheduler.add_job(name, functools.partial(run_streamer, streamer_config, shared), triggers,
+                              catch_up=bool(streamer_schedule.get('catch_up', True)),
+                              jitter_seconds=float(streamer_schedule.get('jitter_seconds', 0)))
+        except ValueError as e:
+            logging.error(f"[调度] 主播 '{name}' 的触发时间配置无效: {e}")
+            sys.exit(1)
+        if streamer_schedule.get('folder_trigger', True):
+            FolderTrigger(
+                scheduler, name, streamer_config['paths']['video_folder'],
+                poll_interval=float(watch_cfg.get('poll_interval', 10)),
+                settle_seconds=float(watch_cfg.get('segment_settle_seconds', 30)),
+                stream_end_seconds=float(watch_cfg.get('stream_end_seconds', 180)),
+            ).start()
+
+    ipc_port = int(schedule_cfg.get('ipc_port', DEFAULT_IPC_PORT))
+    if ipc_port:
         try:
-            main()
-        except Exception as e:
-            logging.exception(f"[调度] main() 执行异常: {e}")
-        end_ts = datetime.now()
-        logging.info(f"[调度] 本次执行结束, 耗时 {(end_ts-start_ts).total_seconds():.1f}s, 等待下一次...")
+            IpcTrigger(scheduler, ipc_port).start()
+        except OSError as e:
+            logging.error(f"[调度] 无法监听触发端口 {ipc_port}: {e}")
+
+    logging.info(f"[调度] 已启动常驻模式，共 {len(streamers)} 个主播")
+    try:
+        scheduler.run_forever()
+    finally:
+        bandwidth.stop()
 
 
 if __name__ == '__main__':
+    # 打包为 exe 后，上传流程中完整性检查使用的进程池需要此调用
+    multiprocessing.freeze_support()
     parser = argparse.ArgumentParser(description='ts.py 脚本 (支持每日定时执行)')
-    parser.add_argument('--daily', action='store_true', help='进入常驻模式, 每天固定时间执行一次')
-    parser.add_argument('--time', default='03:00', help='每日执行时间 HH:MM, 默认 03:00')
+    parser.add_argument('--daily', action='store_true', help='进入常驻模式, 按 schedule 设置定时执行')
+    parser.add_argument('--time', action='append',
+                        help='每日执行时间 HH:MM, 可重复指定; 默认使用 schedule.triggers, 未配置时为 03:00')
+    parser.add_argument('--trigger', nargs='?', const='', metavar='NAME',
+                        help='通知正在运行的常驻实例立即执行一次后退出; 可指定主播名, 默认全部')
     args = parser.parse_args()
+    for t in args.time or []:
+        _parse_time_str(t)
+
+    if args.trigger is not None:
+        # 不初始化日志，避免覆盖常驻实例正在写入的日志文件
+        config_for_trigger = load_config(get_script_dir() / "config.yaml") or {}
+        port = int((config_for_trigger.get('schedule') or {}).get('ipc_port', DEFAULT_IPC_PORT))
+        try:
+            print(f"常驻实例回复: {send_trigger(args.trigger or None, port)}")
+        except OSError as e:
+            print(f"无法连接常驻实例 (端口 {port}): {e}")
+            sys.exit(1)
+        sys.exit(0)
 
     # --- 日志初始化 ---
     # 提前加载配置以获取日志路径
-    if getattr(sys, 'frozen', False):
-        script_dir_for_log = Path(sys.executable).parent
-    else:
-        script_dir_for_log = Path(__file__).resolve().parent
-    
-    config_for_log = load_config(script_dir_for_log / "config.yaml")
+    config_for_log = load_config(get_script_dir() / "config.yaml")
     if not config_for_log:
         # 如果配置加载失败，至少保证控制台有输出
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -185,7 +285,7 @@ if __name__ == '__main__':
     
     log_path_str = config_for_log.get('paths', {}).get('log_file1')
     if log_path_str:
-        setup_logging(Path(log_path_str))
+        setup_logging(Path(log_path_str), config_for_log.get('logging'))
     else:
         # 如果日志路径未在配置中定义，也保证控制台输出
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -193,7 +293,6 @@ if __name__ == '__main__':
     # --- 日志初始化结束 ---
 
     if args.daily:
-        hour, minute = _parse_time_str(args.time)
-        run_daily(hour, minute)
+        run_scheduled(config_for_log, args.time)
     else:
-        main()
\ No newline at end of file
+        sys.exit(main() or 0)
\ No newline at end of file
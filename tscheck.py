@@ -0,0 +1,255 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import logging
+import mmap
+import os
+import time
+
+# numpy 导入较慢，只在真正需要检查 TS 分段时才加载（见 _load_numpy）
+np = None
+_numpy_loaded = False
+
+TS_PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+NULL_PID = 0x1FFF
+# 每次映射扫描的包数（约 64 MB）
+WINDOW_PACKETS = (64 * 1024 * 1024) // TS_PACKET_SIZE
+# 确认同步位置时要求连续命中的同步字节数
+SYNC_CONFIRM_PACKETS = 5
+# 少于该包数的分段视为无效（通常是录制刚开始就被中断的空文件）
+MIN_PACKETS = 10
+# 末尾最多裁掉的坏包数，超过时不裁剪，尾部乱码计入同步错误
+MAX_TAIL_TRIM_PACKETS = 8
+DEFAULT_MAX_BAD_RATIO = 0.01
+# 最近该秒数内仍被写入的分段视为正在录制，不做裁剪
+DEFAULT_ACTIVE_SECONDS = 60
+
+
+def _load_numpy():
+    """按需导入 numpy，未安装时返回 None"""
+    global np, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+    return np
+
+
+def _find_sync_offset(buf, size, start=0):
+    """从 start 开始找到第一个能连续对上 188 字节同步格点的偏移"""
+    limit = min(size - TS_PACKET_SIZE * SYNC_CONFIRM_PACKETS, start + TS_PACKET_SIZE * 1024)
+    for offset in range(start, limit + 1):
+        if all(buf[offset + i * TS_PACKET_SIZE] == SYNC_BYTE for i in range(SYNC_CONFIRM_PACKETS)):
+            return offset
+    return None
+
+
+def _scan_numpy(buf, offset, packets, last_cc):
+    """向量化扫描: 返回 (同步错误的包序号数组, 连续计数器错误数)"""
+    bad_indexes = []
+    cc_errors = 0
+    for start in range(0, packets, WINDOW_PACKETS):
+        count = min(WINDOW_PACKETS, packets - start)
+        pkts = np.frombuffer(buf, dtype=np.uint8, count=count * TS_PACKET_SIZE,
+                             offset=offset + start * TS_PACKET_SIZE).reshape(count, TS_PACKET_SIZE)
+        header = pkts[:, :4]
+        sync_ok = header[:, 0] == SYNC_BYTE
+        bad = np.flatnonzero(~sync_ok)
+        if bad.size:
+            bad_indexes.append(bad + start)
+
+        # 连续计数器: 同一 PID 的有效载荷包 CC 应逐个 +1 (mod 16)，允许一次重复包
+        pid = ((header[:, 1].astype(np.uint16) & 0x1F) << 8) | header[:, 2]
+        has_payload = (header[:, 3] & 0x10) != 0
+        mask = sync_ok & has_payload & (pid != NULL_PID)
+        pid, cc = pid[mask], header[mask, 3] & 0x0F
+        if not pid.size:
+            continue
+        order = np.argsort(pid, kind='stable')
+        pid, cc = pid[order], cc[order]
+        same_pid = pid[1:] == pid[:-1]
+        step = (cc[1:].astype(np.int16) - cc[:-1]) % 16
+        cc_errors += int(np.count_nonzero(same_pid & (step != 1) & (step != 0)))
+
+        # 窗口边界: 每个 PID 的第一个包与上一窗口的最后一个包比较
+        group_starts = np.flatnonzero(np.concatenate(([True], ~same_pid)))
+        group_ends = np.concatenate((group_starts[1:] - 1, [pid.size - 1]))
+        for first, last in zip(group_starts, group_ends):
+            p = int(pid[first])
+            if p in last_cc and (int(cc[first]) - last_cc[p]) % 16 not in (0, 1):
+                cc_errors += 1
+            last_cc[p] = int(cc[last])
+
+    bad = np.concatenate(bad_indexes) if bad_indexes else np.empty(0, dtype=np.int64)
+    return bad, cc_errors
+
+
+def _scan_python(buf, offset, packets):
+    """无 NumPy 时的退化实现: 只检查同步字节（步长切片在 C 层完成），不检查连续计数器"""
+    sync_bytes = buf[offset:offset + packets * TS_PACKET_SIZE:TS_PACKET_SIZE]
+    bad = [i for i, b in enumerate(sync_bytes) if b != SYNC_BYTE]
+    return bad, 0
+
+
+def _first_bad_run(bad, packets):
+    """返回 bad 中第一段连续坏包的起始位置: 长度至少 SYNC_CONFIRM_PACKETS 或一直延续到末尾；没有时返回 None"""
+    run_start = 0
+    for i in range(1, len(bad) + 1):
+        if i == len(bad) or bad[i] != bad[i - 1] + 1:
+            if i - run_start >= SYNC_CONFIRM_PACKETS or bad[i - 1] == packets - 1:
+                return run_start
+            run_start = i
+    return None
+
+
+def check_segment(path, trim_tail=True, max_bad_ratio=DEFAULT_MAX_BAD_RATIO):
+    """检查一个 MPEG-TS 分段的完整性。
+
+    检查 188 字节包的同步字节格点与各 PID 的连续计数器:
+      - 文件中间丢失或多出字节导致格点偏移: 从下一个能对上的格点继续扫描，跳过的区域计入同步错误
+      - 末尾被截断的半个包或尾部不超过 MAX_TAIL_TRIM_PACKETS 个乱码包（录制软件被强制结束）:
+        trim_tail 时原地截掉；尾部乱码更多时不裁剪，计入同步错误
+      - 同步错误比例超过 max_bad_ratio，或找不到同步格点: 判为损坏，排除上传
+    返回检查结果 dict: path / ok / packets / trimmed / sync_errors / cc_errors / reason
+    """
+    path = Path(path)
+    result = {'path': str(path), 'ok': False, 'packets': 0, 'trimmed': 0,
+              'sync_errors': 0, 'cc_errors': 0, 'reason': ''}
+    size = path.stat().st_size
+    if size < TS_PACKET_SIZE * MIN_PACKETS:
+        result['reason'] = f'文件过小 ({size} 字节)'
+        return result
+
+    use_numpy = _load_numpy() is not None
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        offset = _find_sync_offset(buf, size)
+        if offset is None:
+            result['reason'] = '找不到 TS 同步字节'
+            return result
+        good_packets = sync_errors = cc_errors = 0
+        last_cc = {}
+        valid_end = size
+        while True:
+            packets = (size - offset) // TS_PACKET_SIZE
+            cc_before = dict(last_cc)
+            if use_numpy:
+                bad, cc = _scan_numpy(buf, offset, packets, last_cc)
+                bad = bad.tolist()
+            else:
+                bad, cc = _scan_python(buf, offset, packets)
+            run = _first_bad_run(bad, packets)
+            if run is None:
+                good_packets += packets - len(bad)
+                sync_errors += len(bad)
+                cc_errors += cc
+                valid_end = offset + packets * TS_PACKET_SIZE
+                break
+
+            # 连续坏包之前的部分照常计数，零星坏包算作同步错误
+            run_packet = bad[run]
+            good_packets += run_packet - run
+            sync_errors += run
+            if use_numpy:
+                # 错位之后的包不属于这个格点，只统计坏包之前的连续计数器
+                last_cc = cc_before
+                cc = _scan_numpy(buf, offset, run_packet, last_cc)[1]
+            cc_errors += cc
+            bad_start = offset + run_packet * TS_PACKET_SIZE
+            resync = _find_sync_offset(buf, size, bad_start)
+            if resync is not None:
+                # 中间丢失或多出了字节: 从新的格点继续，跳过的字节计入同步错误
+                skipped = -(-(resync - bad_start) // TS_PACKET_SIZE)
+                sync_errors += skipped
+                logging.debug(f"{path.name}: 第 {good_packets} 个有效包之后同步格点偏移，跳过 {resync - bad_start} 字节")
+                offset = resync
+                continue
+            tail_bad = -(-(size - bad_start) // TS_PACKET_SIZE)
+            if tail_bad <= MAX_TAIL_TRIM_PACKETS:
+                valid_end = bad_start
+            else:
+                # 尾部乱码过多时不裁剪（可能是被截断之外的损坏），只计入同步错误
+                sync_errors += tail_bad
+            break
+
+    result.update(packets=good_packets, sync_errors=sync_errors, cc_errors=cc_errors)
+    if good_packets < MIN_PACKETS:
+        result['reason'] = f'有效 TS 包过少 ({good_packets})'
+        return result
+    if sync_errors > good_packets * max_bad_ratio:
+        result['reason'] = f'同步错误过多 ({sync_errors}/{good_packets})'
+        return result
+
+    if valid_end < size:
+        if not trim_tail:
+            result['reason'] = f'末尾有 {size - valid_end} 字节不完整数据'
+            return result
+        os.truncate(path, valid_end)
+        result['trimmed'] = size - valid_end
+    result['ok'] = True
+    return result
+
+
+def _check_segment_safe(args):
+    path, trim_tail, max_bad_ratio = args
+    try:
+        return check_segment(path, trim_tail, max_bad_ratio)
+    except (OSError, ValueError) as e:
+        return {'path': str(path), 'ok': False, 'packets': 0, 'trimmed': 0,
+                'sync_errors': 0, 'cc_errors': 0, 'reason': f'读取失败: {e}'}
+
+
+def validate_segments(video_paths, validate_cfg=None, checked=None):
+    """用进程池并行检查所有 .ts 分段，返回通过检查的文件列表（保持原顺序）。
+
+    非 .ts 文件（mp4/flv）不做检查直接通过；仍在写入的分段不检查也不返回，等写完后的下一次扫描再检查。
+    传入列表 checked 时，实际检查并通过的分段会追加到其中。
+    """
+    validate_cfg = validate_cfg or {}
+    if not validate_cfg.get('enabled', True):
+        return list(video_paths)
+
+    active_seconds = float(validate_cfg.get('active_seconds', DEFAULT_ACTIVE_SECONDS))
+    now = time.time()
+    ts_paths, active = [], set()
+    for p in video_paths:
+        if p.suffix.lower() != '.ts':
+            continue
+        if now - p.stat().st_mtime < active_seconds:
+            # 录制软件仍在写入，裁剪会破坏正在录制的文件；写完之前也不能上传
+            logging.warning(f"分段 {p.name} 仍在写入，暂不检查和上传。")
+            active.add(p)
+            continue
+        ts_paths.append(p)
+    if not ts_paths:
+        return [p for p in video_paths if p not in active]
+    trim_tail = bool(validate_cfg.get('trim_tail', True))
+    max_bad_ratio = float(validate_cfg.get('max_bad_ratio', DEFAULT_MAX_BAD_RATIO))
+    workers = int(validate_cfg.get('workers', 0)) or min(len(ts_paths), os.cpu_count() or 1)
+
+    logging.info(f"正在检查 {len(ts_paths)} 个 TS 分段的完整性 ({workers} 个进程)...")
+    if _load_numpy() is None:
+        logging.warning("未安装 numpy，仅检查同步字节，不检查连续计数器。")
+    jobs = [(p, trim_tail, max_bad_ratio) for p in ts_paths]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_check_segment_safe, jobs))
+    else:
+        results = [_check_segment_safe(job) for job in jobs]
+
+    rejected = set()
+    for result in results:
+        name = Path(result['path']).name
+        if not result['ok']:
+            rejected.add(result['path'])
+            logging.error(f"分段 {name} 未通过完整性检查，跳过上传: {result['reason']}")
+            continue
+        if result['trimmed']:
+            logging.warning(f"分段 {name} 末尾被截断，已裁掉 {result['trimmed']} 字节不完整数据。")
+        if result['sync_errors'] or result['cc_errors']:
+            logging.warning(f"分段 {name}: {result['sync_errors']} 个同步错误, {result['cc_errors']} 个连续计数器错误")
+    if checked is not None:
+        checked.extend(p for p in ts_paths if str(p) not in rejected)
+    return [p for p in video_paths if p not in active and str(p) not in rejected]
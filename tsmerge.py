@@ -0,0 +1,129 @@
+from pathlib import Path
+import errno
+import logging
+import os
+import shutil
+
+# 不支持零拷贝时回退的缓冲区大小
+FALLBACK_BUFFER_SIZE = 8 * 1024 * 1024
+# 单次系统调用最多复制的字节数
+COPY_CHUNK_SIZE = 1024 * 1024 * 1024
+DEFAULT_TARGET_SIZE_MB = 2048
+# 合并前要求磁盘至少保留的余量
+FREE_SPACE_MARGIN = 1024 * 1024 * 1024
+
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def _copy_range(src, dst, count):
+    """把 src 当前位置起的 count 字节追加到 dst，尽量不经过 Python 缓冲区。
+
+    src/dst 为无缓冲的文件对象。依次尝试 os.copy_file_range（Linux；在
+    btrfs/XFS 等文件系统上由内核直接做 reflink 共享数据块）、os.sendfile
+    （Linux 支持文件到文件），都不可用时（例如 Windows）退回到 readinto
+    复用同一块缓冲区。
+    """
+    remaining = count
+    for method in ('copy_file_range', 'sendfile'):
+        func = getattr(os, method, None)
+        if func is None:
+            continue
+        try:
+            while remaining > 0:
+                chunk = min(remaining, COPY_CHUNK_SIZE)
+                if method == 'copy_file_range':
+                    copied = func(src.fileno(), dst.fileno(), chunk)
+                else:
+                    copied = func(dst.fileno(), src.fileno(), None, chunk)
+                if copied == 0:
+                    break
+                remaining -= copied
+            return count - remaining
+        except OSError as e:
+            # 只有一个字节都还没复制时才能安全地换用下一种方式
+            if e.errno not in _UNSUPPORTED_ERRNOS or remaining != count:
+                raise
+
+    view = memoryview(bytearray(min(FALLBACK_BUFFER_SIZE, max(remaining, 1))))
+    while remaining > 0:
+        n = src.readinto(view[:min(remaining, len(view))])
+        if not n:
+            break
+        written = 0
+        while written < n:
+            written += dst.write(view[written:n])
+        remaining -= n
+    return count - remaining
+
+
+def plan_merge(video_paths, target_bytes):
+    """把连续的 .ts 分段分组，每组总大小不超过 target_bytes。
+
+    单个超过目标大小的分段独占一组；mp4/flv 无法按字节拼接，保持单独一组。
+    """
+    groups, current, current_size = [], [], 0
+    for path in video_paths:
+        size = path.stat().st_size
+        if path.suffix.lower() != '.ts':
+            if current:
+                groups.append(current)
+            groups.append([path])
+            current, current_size = [], 0
+            continue
+        if current and current_size + size > target_bytes:
+            groups.append(current)
+            current, current_size = [], 0
+        current.append(path)
+        current_size += size
+    if current:
+        groups.append(current)
+    return groups
+
+
+def merge_group(group, output_path):
+    """把一组 TS 分段按字节拼接为 output_path；已存在且大小一致的合并结果直接复用"""
+    expected = sum(p.stat().st_size for p in group)
+    if output_path.exists() and output_path.stat().st_size == expected:
+        logging.info(f"复用已合并的分段: {output_path.name}")
+        return output_path
+
+    tmp_path = output_path.with_name(output_path.name + '.part')
+    with open(tmp_path, 'wb', buffering=0) as dst:
+        for path in group:
+            with open(path, 'rb', buffering=0) as src:
+                size = os.fstat(src.fileno()).st_size
+                copied = _copy_range(src, dst, size)
+                if copied != size:
+                    raise OSError(f"复制 {path.name} 不完整: {copied}/{size} 字节")
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def iter_merged_parts(video_paths, output_dir, target_size_mb=DEFAULT_TARGET_SIZE_MB, name=None):
+    """逐组合并并立即产出 (上传用路径, 原始分段列表)。
+
+    以生成器形式产出，调用方可以在下一组合并的同时处理已完成的部分。
+    只有一个分段的组不做复制，直接产出原文件。
+    """
+    output_dir = Path(output_dir)
+    groups = plan_merge(list(video_paths), int(float(target_size_mb) * 1024 * 1024))
+    merged_total = sum(p.stat().st_size for g in groups if len(g) > 1 for p in g)
+    if merged_total:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        free = shutil.disk_usage(output_dir).free
+        if free < merged_total + FREE_SPACE_MARGIN:
+            logging.warning(f"磁盘剩余空间不足以合并分段 (需要 {merged_total / 1024**3:.1f} GB)，将按原分段上传。")
+            for path in video_paths:
+                yield path, [path]
+            return
+
+    prefix = name or Path(video_paths[0]).stem.rsplit('_', 1)[0]
+    for index, group in enumerate(groups):
+        if len(group) == 1:
+            yield group[0], group
+            continue
+        output_path = output_dir / f"{prefix}_merged_{index:03d}{group[0].suffix}"
+        merge_group(group, output_path)
+        logging.info(f"已合并 {len(group)} 个分段 -> {output_path.name} "
+                     f"({output_path.stat().st_size / 1024 / 1024:.0f} MB)")
+        yield output_path, group
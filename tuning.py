@@ -0,0 +1,93 @@
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+import os
+import threading
+
+# 每个时段的小时数：一天分为 6 个时段，分别学习各时段的最佳并发数
+HOURS_PER_SLOT = 4
+# 吞吐量低于历史最佳的比例超过该值时，认为加并发没有收益，退回最佳值
+REGRESSION_TOLERANCE = 0.85
+# 每个时段保留的最近测量数
+MAX_SAMPLES = 20
+# 每次测量前历史最佳吞吐量的衰减系数，让线路变差后仍能重新探索
+BEST_DECAY = 0.95
+
+
+class ConcurrencyTuner:
+    """按上传线路与时段自适应调整 upload_by_app 的单文件并发数 (limit)。
+
+    每次上传尝试作为一个测量窗口，记录达到的吞吐量与是否出错:
+      - 成功且吞吐量不低于历史最佳: 并发数 +1 继续试探（加性增）
+      - 成功但吞吐量明显低于最佳: 退回最佳并发数
+      - 出错（限流、超时等）: 并发数减半（乘性减）
+    结果按 "线路|时段" 持久化到 JSON 文件，下次运行直接从学到的值开始。
+    """
+
+    def __init__(self, state_path, min_limit=1, max_limit=8, initial_limit=3):
+        self.path = Path(state_path)
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.initial_limit = self._clamp(initial_limit)
+        self._lock = threading.Lock()
+        self.state = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"并发调优记录无法读取，将重新学习: {e}")
+
+    def _clamp(self, limit):
+        return max(self.min_limit, min(self.max_limit, int(limit)))
+
+    @staticmethod
+    def _key(line, when=None):
+        hour = (when or datetime.now()).hour
+        return f"{line or 'auto'}|{hour // HOURS_PER_SLOT}"
+
+    def _entry(self, key):
+        return self.state.setdefault(key, {
+            'limit': self.initial_limit, 'best_limit': self.initial_limit, 'best_mbps': 0.0, 'samples': []})
+
+    def suggest(self, line=None):
+        """返回当前线路与时段下建议使用的并发数"""
+        with self._lock:
+            return self._clamp(self._entry(self._key(line))['limit'])
+
+    def record(self, line, limit, ok, size_bytes=0, seconds=0.0):
+        """记录一次上传尝试的结果，并据此调整下次使用的并发数"""
+        key = self._key(line)
+        with self._lock:
+            entry = self._entry(key)
+            mbps = size_bytes * 8 / 1e6 / seconds if ok and seconds > 0 else 0.0
+            entry['best_mbps'] *= BEST_DECAY
+            entry['samples'] = (entry['samples'] + [[limit, round(mbps, 2), ok]])[-MAX_SAMPLES:]
+
+            if not ok:
+                new_limit = self._clamp(limit // 2)
+            elif mbps >= entry['best_mbps']:
+                entry['best_mbps'], entry['best_limit'] = mbps, limit
+                new_limit = self._clamp(limit + 1)
+            elif mbps < entry['best_mbps'] * REGRESSION_TOLERANCE:
+                new_limit = entry['best_limit']
+            else:
+                new_limit = limit
+            entry['limit'] = new_limit
+            self._save()
+
+        if ok:
+            logging.info(f"[并发调优] {key}: 并发 {limit} 达到 {mbps:.1f} Mbit/s，下次使用 {new_limit}")
+        else:
+            logging.info(f"[并发调优] {key}: 并发 {limit} 上传出错，下次降为 {new_limit}")
+        return new_limit
+
+    def _save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"保存并发调优记录失败: {e}")
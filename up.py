@@ -1,15 +1,54 @@
-import stream_gears
 from pathlib import Path
 import sys
 import json
 import logging
 import yaml
-from PIL import Image, ImageDraw, ImageFont
-from datetime import datetime
-import os
 import time
-import subprocess
-import psutil
+import argparse
+import functools
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from journal import UploadJournal, part_key
+from planner import plan_sessions, parse_video_name
+from budget import ConnectionBudget, BandwidthScheduler, is_recording, DEFAULT_LIVE_ACTIVE_SECONDS
+from watcher import SegmentWatcher
+from tuning import ConcurrencyTuner
+from tscheck import check_segment, validate_segments, DEFAULT_MAX_BAD_RATIO
+from tsmerge import iter_merged_parts, DEFAULT_TARGET_SIZE_MB
+from dedup import DedupIndex, DEFAULT_HASH_WORKERS, DUPLICATE_UPLOADED
+from scanindex import DirectoryIndex
+from recorder import RecorderSupervisor
+from login import get_credential_service
+from logsetup import (setup_logging, create_file_handler, add_handler, remove_handler, StreamerFilter,
+                      streamer_context, current_streamer, bind_streamer)
+from metrics import RunMetrics
+from lineprobe import LineSelector
+
+# 失败重试的默认值，可在 config.yaml 的 upload 部分覆盖
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 30  # 首次重试前等待秒数，之后每次翻倍
+MAX_RETRY_BACKOFF = 600
+# 多会话并行上传的默认值，可在 config.yaml 的 upload 部分覆盖
+DEFAULT_MAX_PARALLEL_SESSIONS = 2
+DEFAULT_MAX_CONNECTIONS = 6
+# 单文件上传并发数 (upload_by_app 的 limit) 及自适应调整范围
+DEFAULT_UPLOAD_LIMIT = 3
+DEFAULT_AUTO_LIMIT_MIN = 1
+DEFAULT_AUTO_LIMIT_MAX = 8
+# 投稿信息的默认值，可在 config.yaml 的 upload 部分（或 streamers 中每个主播）覆盖
+DEFAULT_TID = 17
+DEFAULT_TAG = "游戏,单机游戏"
+DEFAULT_SOURCE = "https://live.douyin.com/439720548986"
+DEFAULT_DESC = "直播回放为自动化录制上传 如有侵权 请联系删除"
+# 监视模式的默认值，可在 config.yaml 的 watch 部分覆盖
+DEFAULT_WATCH_POLL_INTERVAL = 10
+DEFAULT_SEGMENT_SETTLE_SECONDS = 30
+DEFAULT_STREAM_END_SECONDS = 180
+# 监视模式下一场直播投稿失败后，重新投稿前等待的秒数（之后每次翻倍）
+DEFAULT_WATCH_RETRY_BACKOFF = 300
+MAX_WATCH_RETRY_BACKOFF = 3600
 
 # --- 功能函数 ---
 
@@ -26,171 +65,300 @@ def load_config(config_path):
             print(f"配置文件格式错误: {e}")
             return None
     
-    paths_cfg = config.get('paths', {})
+    return config if check_config(config) else None
+
+def check_config(config):
+    """检查上传所需的路径设置是否齐全"""
+    paths_cfg = (config or {}).get('paths', {})
     required_paths = ['log_file', 'video_folder', 'cookies_file']
     for key in required_paths:
         if key not in paths_cfg:
             print(f"配置文件 'config.yaml' 的 'paths' 部分缺少设置: '{key}'")
-            return None
-            
-    return config
+            return False
+    return True
 
-def create_cover_image(date_str, script_dir):
-    """根据给定的日期字符串创建一个封面图片，并返回其路径"""
-    img_width, img_height = 1146, 717
-    bg_color, text_color = (25, 25, 25), (255, 255, 255)
-    save_path = script_dir / "cover.jpg"
+# 封面尺寸与配色；同一日期的封面内容完全相同，渲染结果按日期缓存
+COVER_SIZE = (1146, 717)
+COVER_BG_COLOR, COVER_TEXT_COLOR = (25, 25, 25), (255, 255, 255)
+COVER_FONT_SIZE = 120
+# PIL 的字体对象不保证线程安全，同一时间只渲染一张封面（单张只需几毫秒）
+_cover_lock = threading.Lock()
+# 封面在后台线程中渲染，与合并分段、等待上传连接同时进行
+_cover_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cover')
 
+@functools.lru_cache(maxsize=None)
+def load_cover_font(size=COVER_FONT_SIZE):
+    """加载封面字体，每个进程只从磁盘读取一次"""
+    from PIL import ImageFont
     try:
-        image = Image.new('RGB', (img_width, img_height), color=bg_color)
-        draw = ImageDraw.Draw(image)
-        try:
-            font = ImageFont.truetype("msyhbd.ttc", 120)
-        except IOError:
-            logging.warning("未找到 '微软雅黑 Bold' 字体，将使用默认字体。")
-            font = ImageFont.load_default(size=100)
-
-        if hasattr(draw, 'textbbox'):
-            bbox = draw.textbbox((0, 0), date_str, font=font)
-            text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
-        else:
-            text_width, text_height = draw.textsize(date_str, font=font)
-        
-        x, y = (img_width - text_width) / 2, (img_height - text_height) / 2
-        draw.text((x, y), date_str, font=font, fill=text_color)
-        image.save(save_path, 'JPEG')
+        return ImageFont.truetype("msyhbd.ttc", size)
+    except IOError:
+        logging.warning("未找到 '微软雅黑 Bold' 字体，将使用默认字体。")
+        return ImageFont.load_default(size=100)
+
+@functools.lru_cache(maxsize=32)
+def render_cover(date_str):
+    """渲染写有日期的封面，返回 JPEG 数据"""
+    # PIL 只在需要生成封面时才导入，没有日期的投稿不必加载
+    from PIL import Image, ImageDraw
+    img_width, img_height = COVER_SIZE
+    image = Image.new('RGB', COVER_SIZE, color=COVER_BG_COLOR)
+    draw = ImageDraw.Draw(image)
+    font = load_cover_font()
+
+    if hasattr(draw, 'textbbox'):
+        bbox = draw.textbbox((0, 0), date_str, font=font)
+        text_width, text_height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    else:
+        text_width, text_height = draw.textsize(date_str, font=font)
+
+    x, y = (img_width - text_width) / 2, (img_height - text_height) / 2
+    draw.text((x, y), date_str, font=font, fill=COVER_TEXT_COLOR)
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG')
+    return buf.getvalue()
+
+def create_cover_image(date_str, script_dir, file_name="cover.jpg"):
+    """根据给定的日期字符串创建一个封面图片，并返回其路径"""
+    save_path = script_dir / file_name
+    try:
+        with _cover_lock:
+            data = render_cover(date_str)
+        with open(save_path, 'wb') as f:
+            f.write(data)
         logging.info(f"成功创建封面图片: {save_path}")
         return str(save_path)
     except Exception as e:
         logging.error(f"创建封面图片失败: {e}")
         return None
 
-def setup_logging(log_file_path):
-    """配置日志系统"""
-    log_file_path.parent.mkdir(parents=True, exist_ok=True)
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file_path, mode='w', encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    logging.info(f"日志系统初始化完成，日志将记录到: {log_file_path}")
+def get_sorted_videos(video_folder, validate_cfg=None, index=None):
+    """扫描并排序视频文件，只返回通过完整性检查的分段
 
-def get_sorted_videos(video_folder):
-    """扫描并排序视频文件"""
-    logging.info(f"正在扫描文件夹: {video_folder}")
-    logging.info(f"完整绝对路径为: {video_folder.resolve()}")
-    video_paths = list(video_folder.glob('*.ts')) + list(video_folder.glob('*.mp4')) + list(video_folder.glob('*.flv'))
+    传入目录索引时，上次已通过检查且未变化的分段不再重复检查。
+    """
+    logging.info(f"正在扫描文件夹: {video_folder.resolve()}")
+    index = index or DirectoryIndex()
+    try:
+        video_paths, changed = index.scan(video_folder)
+    except OSError as e:
+        logging.error(f"扫描文件夹失败: {e}")
+        return []
 
     if not video_paths:
         logging.info("未找到需要上传的视频文件，程序退出。")
         return []
+    logging.info(f"找到 {len(video_paths)} 个视频文件，其中 {len(changed)} 个为新增或有变化。")
+    for path in changed:
+        logging.info(f"  + {path.name}")
 
-    logging.info("正在根据文件名末尾的数字排序...")
-    try:
-        video_paths.sort(key=lambda p: int(p.stem.split('_')[-1]))
-    except (ValueError, IndexError):
-        logging.warning("无法按数字后缀排序，将使用默认字母顺序排序。")
-        video_paths.sort()
+    validate_cfg = validate_cfg or {}
+    if validate_cfg.get('enabled', True):
+        to_check = [p for p in video_paths if not index.is_checked(p)]
+        checked = [p for p in to_check if p.suffix.lower() != '.ts']
+        passed = set(validate_segments(to_check, validate_cfg, checked))
+        index.mark_checked(checked)
+        video_paths = [p for p in video_paths if p in passed or index.is_checked(p)]
+    index.save()
+    if not video_paths:
+        logging.info("没有通过完整性检查的视频文件，程序退出。")
+        return []
 
-    logging.info(f"排序完成，将按以下顺序上传 {len(video_paths)} 个视频:")
+    logging.info(f"排序完成，将上传 {len(video_paths)} 个视频: {video_paths[0].name} ... {video_paths[-1].name}")
     for path in video_paths:
-        logging.info(f"  => {path.name}")
+        logging.debug(f"  => {path.name}")
     return video_paths
 
 def extract_metadata(video_paths):
     """从文件名解析标题和日期"""
     title, date = "默认标题", ""
     first_part_video = next((p for p in video_paths if p.stem.endswith('_000')), None)
+    if not first_part_video:
+        # 起始分段可能已在之前的投稿中上传，退而使用本组第一个分段
+        first_part_video = next((p for p in video_paths if parse_video_name(p)), None)
+        if first_part_video:
+            logging.warning(f"未找到以 '_000' 结尾的视频，将从 {first_part_video.name} 解析标题和日期。")
 
     if first_part_video:
         logging.info(f"找到起始视频: {first_part_video.name}，将从中解析标题和日期。")
-        try:
-            parts = first_part_video.stem.split('_')
-            if len(parts) >= 2:
-                title, date = parts[0], parts[1]
-                logging.info(f"成功解析 -> 标题: '{title}', 日期: '{date}'")
-            else:
-                logging.warning("文件名格式不符合 '标题_日期_...' 规范，将使用默认标题。")
-        except (ValueError, IndexError) as e:
-            logging.error(f"解析文件名时出错: {e}，将使用默认标题。")
+        parsed = parse_video_name(first_part_video)
+        if parsed:
+            title, date = parsed[0], parsed[1]
+            logging.info(f"成功解析 -> 标题: '{title}', 日期: '{date}'")
+        else:
+            logging.warning("文件名格式不符合 '标题_日期_...' 规范，将使用默认标题。")
     else:
         logging.warning("未找到以 '_000' 结尾的视频，将使用默认标题。")
     return title, date
 
-def process_upload_result(result_json_string, video_paths, cover_path, behavior_cfg):
-    """处理上传结果，成功则清理文件"""
-    upload_data = json.loads(result_json_string)
+def process_upload_result(result_json_string):
+    """解析上传结果，成功返回服务器数据，失败返回 None"""
+    try:
+        upload_data = json.loads(result_json_string)
+    except ValueError:
+        logging.error(f"无法解析服务器返回: {result_json_string}")
+        return None
     if upload_data.get('code') == 0:
         logging.info("视频上传成功！")
         if 'data' in upload_data and 'bvid' in upload_data['data']:
             bvid = upload_data['data']['bvid']
             logging.info(f"视频的 BVID 是: {bvid}")
             logging.info(f"访问链接: https://www.bilibili.com/video/{bvid}")
-        
-        if behavior_cfg.get('delete_after_upload', False):
-            logging.info("准备删除已上传的本地文件...")
-            files_to_delete = video_paths + ([Path(cover_path)] if cover_path else [])
-            for file_path in files_to_delete:
-                if file_path.exists():
-                    try:
-                        file_path.unlink()
-                        logging.info(f"已删除文件: {file_path.name}")
-                    except Exception as e:
-                        logging.error(f"删除文件 {file_path.name} 失败: {e}")
-    else:
-        error_code = upload_data.get('code', 'N/A')
-        error_message = upload_data.get('message', '无详细信息')
-        logging.error(f"上传失败! Code: {error_code}, Message: {error_message}")
-        logging.error(f"完整返回数据: {upload_data}")
-        sys.exit(1)
+        return upload_data
 
-# --- 主程序 ---
+    error_code = upload_data.get('code', 'N/A')
+    error_message = upload_data.get('message', '无详细信息')
+    logging.error(f"上传失败! Code: {error_code}, Message: {error_message}")
+    logging.error(f"完整返回数据: {upload_data}")
+    return None
 
-def main():
-    # 1. 确定根目录 (兼容PyInstaller)
-    if getattr(sys, 'frozen', False):
-        # 如果是打包后的 .exe 文件，根目录是 .exe 文件所在的目录
-        script_dir = Path(sys.executable).parent
+def cleanup_uploaded_files(video_paths, cover_path, behavior_cfg):
+    """按配置删除已上传的本地文件"""
+    if not behavior_cfg.get('delete_after_upload', False):
+        return
+    logging.info("准备删除已上传的本地文件...")
+    files_to_delete = video_paths + ([Path(cover_path)] if cover_path else [])
+    for file_path in files_to_delete:
+        if file_path.exists():
+            try:
+                file_path.unlink()
+                logging.info(f"已删除文件: {file_path.name}", extra={'part': file_path.name})
+            except Exception as e:
+                logging.error(f"删除文件 {file_path.name} 失败: {e}")
 
-    else:
-        # 如果是普通的 .py 脚本，根目录是脚本文件所在的目录
-        script_dir = Path(__file__).resolve().parent
+def skip_uploaded_parts(video_paths, journal, behavior_cfg):
+    """剔除日志簿中已投稿成功的分段（例如上次在清理前中断），按配置补做清理"""
+    remaining, uploaded = [], {}
+    for path in video_paths:
+        key = part_key(path)
+        if journal.is_uploaded(key):
+            uploaded.setdefault(journal.session_of(key), []).append(path)
+        else:
+            remaining.append(path)
 
-    # 2. 加载配置
-    config = load_config(script_dir / "config.yaml")
-    if not config:
-        sys.exit(1)
-    
-    paths_cfg = config.get('paths', {})
-    behavior_cfg = config.get('behavior', {})
+    for session_id, paths in uploaded.items():
+        bvid = journal.session(session_id)['bvid']
+        logging.info(f"{len(paths)} 个分段已在会话 {session_id} 中投稿成功 (BVID: {bvid})，跳过上传。")
+        cleanup_uploaded_files(paths, None, behavior_cfg)
+        if behavior_cfg.get('delete_after_upload', False):
+            journal.mark_cleaned(session_id)
+    return remaining
 
-    # 2. 初始化日志
-    setup_logging(Path(paths_cfg['log_file']))
-    logging.info(f"脚本所在目录: {script_dir}")
+def skip_duplicate_parts(video_paths, dedup, behavior_cfg):
+    """剔除内容已上传过的文件（例如改名后的旧分段、录制软件重复写出的分段）"""
+    started = time.monotonic()
+    remaining, duplicates = dedup.filter_duplicates(video_paths)
+    for path, _, reason in duplicates:
+        logging.warning(f"跳过重复文件 {path.name}: {reason}")
+    # 只有与历史投稿重复的文件才按配置删除；同批次中的重复文件保留给用户处理
+    uploaded = [p for p, kind, _ in duplicates if kind == DUPLICATE_UPLOADED]
+    if uploaded:
+        cleanup_uploaded_files(uploaded, None, behavior_cfg)
+    logging.info(f"内容去重检查完成，用时 {time.monotonic() - started:.1f} 秒，跳过 {len(duplicates)} 个重复文件。")
+    return remaining
 
-    # 3. 获取并排序视频文件
-    video_paths = get_sorted_videos(Path(paths_cfg['video_folder']))
-    if not video_paths:
-        sys.exit(0)
+def choose_upload_line(upload_cfg, lines=None):
+    """返回本次上传使用的线路名: upload.line 指定时固定使用，否则取探测结果；None 表示默认线路"""
+    if upload_cfg.get('line'):
+        return upload_cfg['line']
+    return lines.select() if lines else None
 
-    cookie_file = Path(paths_cfg['cookies_file'])
-    if not cookie_file.exists():
-        logging.error(f"错误: Cookies 文件未找到 -> {cookie_file}")
-        sys.exit(1)
+def upload_with_retry(journal, session_id, video_paths, cookie_file, video_info, upload_cfg, tuner=None, metrics=None,
+                      lines=None, budget=None, reservation=None):
+    """执行上传，失败时按指数退避重试；每次尝试与结果都写入日志簿
 
-    # 4. 准备上传元数据
-    title_from_file, date_str_for_title = extract_metadata(video_paths)
-    
-    cover_path = ""
-    if date_str_for_title:
-        final_title = f"直播回放-{title_from_file}-{date_str_for_title}"
-        cover_path = create_cover_image(date_str_for_title, script_dir) or ""
-    else:
-        final_title = title_from_file
+    budget 与 reservation 一起传入: 调用方已从 budget 申请了 reservation['count'] 个连接。
+    并发数调小时立即归还多出的连接，退避等待期间归还全部连接，重试前按当前上限重新申请，
+    带宽规则的变化从下一次尝试开始生效；reservation['count'] 始终等于仍占用的连接数，
+    返回后由调用方归还。
+    传入 tuner 时每次尝试前按其建议调整并发数（不超过已申请到的连接数），
+    并把本次吞吐量或错误反馈给它（按所用线路分别学习）。传入 metrics 时记录每次
+    尝试的耗时，以及本会话的分段数、字节数、重试次数与速率。传入 lines 时每次
+    尝试前选用探测到的最快线路，并把实际速率反馈给它，线路变慢或出错时重新探测。
+    """
+    metrics = metrics or RunMetrics()
+    max_retries = int(upload_cfg.get('max_retries', DEFAULT_MAX_RETRIES))
+    backoff = float(upload_cfg.get('retry_backoff', DEFAULT_RETRY_BACKOFF))
+    configured_limit = int(upload_cfg.get('limit', DEFAULT_UPLOAD_LIMIT))
+    total_bytes = sum(p.stat().st_size for p in video_paths)
+    first_started = time.monotonic()
+
+    # 只导入一次且放在重试循环之外: 缺少模块是配置问题，重试也无济于事
+    import stream_gears
+    for retry in range(max_retries + 1):
+        # 线路与并发数在登记尝试之前确定，这里出错时日志簿中不会留下停在"上传中"的尝试
+        line = choose_upload_line(upload_cfg, lines)
+        upload_line = getattr(stream_gears.UploadLine, line, None) if line else None
+        if line and upload_line is None:
+            logging.warning(f"未知的上传线路 '{line}'，使用默认线路。")
+            line = None
+        if budget and retry:
+            reservation['count'] = budget.acquire(tuner.suggest(line) if tuner else configured_limit)
+            video_info["limit"] = reservation['count']
+        if tuner:
+            video_info["limit"] = min(tuner.suggest(line), video_info["limit"])
+        if budget and video_info["limit"] < reservation['count']:
+            budget.release(reservation['count'] - video_info["limit"])
+            reservation['count'] = video_info["limit"]
+        attempt = journal.start_attempt(session_id)
+        log_fields = {'session': session_id, 'parts': len(video_paths), 'bytes': total_bytes}
+        logging.info(f"开始上传 (第 {attempt} 次尝试, 线路 {line or '默认'}, 并发 {video_info['limit']})，"
+                     f"标题: '{video_info['title']}'", extra=log_fields)
+        started = time.monotonic()
+        try:
+            result_json = stream_gears.upload_by_app(
+                video_path=video_paths,
+                cookie_file=cookie_file,
+                title=video_info["title"],
+                tid=video_info["tid"],
+                tag=video_info["tag"],
+                copyright=video_info["copyright"],
+                source=video_info["source"],
+                desc=video_info["desc"],
+                cover=video_info["cover"],
+                limit=video_info["limit"],
+                line=upload_line,
+                extra_fields=video_info["extra-fields"]
+            )
+            elapsed = time.monotonic() - started
+            metrics.record_stage('upload', elapsed)
+            logging.info(f"服务器返回: {result_json}", extra={**log_fields, 'elapsed': round(elapsed, 3)})
+            upload_data = process_upload_result(result_json)
+            if upload_data is not None:
+                data = upload_data.get('data') or {}
+                journal.mark_submitted(session_id, bvid=data.get('bvid'), aid=data.get('aid'))
+                if tuner:
+                    tuner.record(line, video_info["limit"], True, total_bytes, elapsed)
+                if lines:
+                    lines.observe(line, total_bytes, elapsed, True)
+                metrics.record_session(video_info["title"], len(video_paths), total_bytes, elapsed, retry, True, line)
+                return upload_data
+            journal.mark_failed(session_id, result_json)
+        except Exception as e:
+            metrics.record_stage('upload', time.monotonic() - started)
+            logging.error(f"上传过程中发生错误: {e}",
+                          extra={**log_fields, 'elapsed': round(time.monotonic() - started, 3)})
+            journal.mark_failed(session_id, e)
+            # 连接类错误可能是线路问题或并发过高；服务器返回的错误码与线路和并发无关，不计入
+            if tuner:
+                tuner.record(line, video_info["limit"], False)
+            if lines:
+                lines.observe(line, 0, 0, False)
 
+        if retry < max_retries:
+            delay = min(backoff * 2 ** retry, MAX_RETRY_BACKOFF)
+            logging.info(f"{delay:.0f} 秒后重试 ({retry + 1}/{max_retries})...")
+            if budget:
+                budget.release(reservation['count'])
+                reservation['count'] = 0
+            time.sleep(delay)
+    metrics.record_session(video_info["title"], len(video_paths), total_bytes,
+                           time.monotonic() - first_started, max_retries, False, line)
+    return None
+
+def build_video_info(final_title, cover_path, config):
+    """组合投稿元数据"""
+    upload_cfg = config.get('upload') or {}
     # 读取是否仅自己可见的配置，默认True
     only_self = True
     if 'only_self' in config:
@@ -227,72 +395,454 @@ def main():
     """
     video_info = {
         "title": final_title,       # 最终的视频标题 (例如: "游戏解说-2025-08-11")
-        "tid": 17,                 # 视频分区ID (171 = 单机游戏)
-        "tag": "游戏,单机游戏",     # 视频标签，多个标签用英文逗号隔开
+        "tid": int(upload_cfg.get('tid', DEFAULT_TID)),                 # 视频分区ID (171 = 单机游戏)
+        "tag": upload_cfg.get('tag', DEFAULT_TAG),     # 视频标签，多个标签用英文逗号隔开
         "copyright": 2,             # 稿件类型 (1 = 自制, 2 = 转载)
-        "source": "https://live.douyin.com/439720548986",               # 转载来源 (如果是自制视频，可以留空)
-        "desc": "直播回放为自动化录制上传 如有侵权 请联系删除",                 # 视频简介 (可以留空)
+        "source": upload_cfg.get('source', DEFAULT_SOURCE),               # 转载来源 (如果是自制视频，可以留空)
+        "desc": upload_cfg.get('desc', DEFAULT_DESC),                 # 视频简介 (可以留空)
         "cover": cover_path,        # 封面图片路径 (如果为空，B站会自动生成)
-        "limit": 3,                 # 上传并发线程数
+        "limit": int(upload_cfg.get('limit', DEFAULT_UPLOAD_LIMIT)),  # 上传并发线程数
         # B站投稿附加参数: is_only_self=1 表示 "仅自己可见"
         "extra-fields": '{\"is_only_self\":%d}' % (1 if only_self else 0)
     }
     logging.info(f"服务器返回: {video_info['extra-fields']}")
+    return video_info
+
+def merge_session_parts(session, config):
+    """按配置把会话的 TS 分段拼接为较大的上传分段，返回 (上传用路径, 临时合并文件)"""
+    merge_cfg = config.get('merge') or {}
+    video_paths = session['parts']
+    if not merge_cfg.get('enabled', False) or len(video_paths) < 2:
+        return video_paths, []
+
+    output_dir = Path(merge_cfg.get('output_dir') or Path(config['paths']['video_folder']) / '_merged')
+    upload_paths, merged_paths = [], []
+    try:
+        for upload_path, sources in iter_merged_parts(
+                video_paths, output_dir, merge_cfg.get('target_size_mb', DEFAULT_TARGET_SIZE_MB), session['name']):
+            upload_paths.append(upload_path)
+            if len(sources) > 1:
+                merged_paths.append(upload_path)
+    except OSError as e:
+        logging.error(f"[{session['name']}] 合并分段失败，将按原分段上传: {e}")
+        for path in merged_paths:
+            path.unlink(missing_ok=True)
+        return video_paths, []
+    logging.info(f"[{session['name']}] {len(video_paths)} 个分段合并为 {len(upload_paths)} 个上传分段")
+    return upload_paths, merged_paths
+
+def render_session_cover(date_str, script_dir, file_name, metrics):
+    """在后台线程中生成会话封面并记录耗时，返回封面路径（生成失败时为空字符串）"""
+    with metrics.stage('cover'):
+        return create_cover_image(date_str, script_dir, file_name) or ""
+
+def cleanup_session(video_paths, cover_path, merged_paths, behavior_cfg, journal, session_id, metrics,
+                    dedup=None, bvid=None):
+    """登记内容指纹并清理已上传的文件；合并产生的临时文件无论配置如何都删除"""
+    with metrics.stage('cleanup'):
+        # 完整哈希要读完整个文件，放在后台清理中计算；必须在删除之前登记
+        if dedup:
+            dedup.record(video_paths, bvid)
+        cleanup_uploaded_files(video_paths, cover_path, behavior_cfg)
+        for path in merged_paths:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logging.error(f"删除合并文件 {path.name} 失败: {e}")
+    if behavior_cfg.get('delete_after_upload', False):
+        journal.mark_cleaned(session_id)
+
+def cleanup_session_in_background(name, args):
+    """在后台清理线程中执行 cleanup_session；没有调用方接收异常，出错时在此记录"""
+    try:
+        cleanup_session(*args)
+    except Exception as e:
+        logging.error(f"[{name}] 清理已上传文件时发生错误: {e}")
+
+def upload_session(session, config, script_dir, cookie_file, journal, budget, tuner=None, dedup=None,
+                   metrics=None, cleaner=None, lines=None):
+    """处理一个投稿会话：解析元数据、生成封面、上传并清理，返回是否成功
+
+    封面在后台渲染，同时进行分段合并与上传连接的申请，上传开始前才等待封面；
+    传入 cleaner（单线程的 ThreadPoolExecutor）时，上传成功后的删除交给它在后台完成，
+    本函数立即返回，不占用下一个会话的时间。
+    """
+    metrics = metrics or RunMetrics()
+    behavior_cfg = config.get('behavior', {})
+    video_paths = session['parts']
+    logging.info(f"[{session['name']}] 开始处理，共 {len(video_paths)} 个分段")
+
+    # 准备上传元数据
+    with metrics.stage('metadata'):
+        title_from_file, date_str_for_title = extract_metadata(video_paths)
+
+    cover_future = None
+    if date_str_for_title:
+        final_title = f"直播回放-{title_from_file}-{date_str_for_title}"
+        # 并行上传时每个会话使用自己的封面文件，避免互相覆盖或提前删除
+        cover_future = _cover_pool.submit(bind_streamer(render_session_cover), date_str_for_title, script_dir,
+                                          f"cover_{session['name']}.jpg", metrics)
+    else:
+        final_title = title_from_file
+
+    video_info = build_video_info(final_title, "", config)
+    if tuner:
+        video_info["limit"] = tuner.suggest(choose_upload_line(config.get('upload') or {}, lines))
+
+    # 可选: 把小分段拼接为更大的上传分段，减少每个分段的握手与预上传往返
+    upload_paths, merged_paths = merge_session_parts(session, config)
+
+    # 执行上传（失败自动重试，进度记录在日志簿中）；连接数计入全局上限
+    session_id = journal.open_session(final_title, [part_key(p) for p in video_paths])
+    # 占用的连接数单独记录: upload_with_retry 会调整 video_info["limit"]，归还时必须按实际占用的数量
+    reservation = {'count': budget.acquire(video_info["limit"])}
+    video_info["limit"] = reservation['count']
+    try:
+        cover_path = cover_future.result() if cover_future else ""
+        video_info["cover"] = cover_path
+        upload_data = upload_with_retry(
+            journal, session_id, upload_paths, cookie_file, video_info, config.get('upload') or {}, tuner, metrics,
+            lines, budget, reservation)
+    finally:
+        budget.release(reservation['count'])
+    if upload_data is None:
+        logging.error(f"[{session['name']}] 多次重试后仍上传失败，保留本地文件，下次运行将继续该投稿。")
+        return False
+
+    # 清理时先登记内容指纹，之后同样内容的文件不会被再次投稿
+    args = (video_paths, cover_path, merged_paths, behavior_cfg, journal, session_id, metrics,
+            dedup, (upload_data.get('data') or {}).get('bvid'))
+    if cleaner:
+        cleaner.submit(bind_streamer(cleanup_session_in_background), session['name'], args)
+    else:
+        cleanup_session(*args)
+    return True
 
-    # 5. 执行上传
+def recording_streamer_folders(config):
+    """多主播共用录制软件时，返回仍在录制的主播录制目录（单个主播时总是返回空列表）"""
+    paths_cfg = config.get('paths', {})
+    folders = paths_cfg.get('streamer_folders') or []
+    if len(folders) < 2:
+        return []
+    active_seconds = float((config.get('recorder') or {}).get('live_active_seconds', DEFAULT_LIVE_ACTIVE_SECONDS))
+    return [str(f) for f in folders if is_recording(f, active_seconds)]
+
+def restart_recorder(config):
+    """检查并重启录制软件，返回录制中断的秒数（未重启时返回 None）"""
+    return RecorderSupervisor(config, get_script_dir()).restart()
+
+def create_dedup_index(config, script_dir):
+    """按配置创建内容指纹索引；dedup.enabled=false 时不做内容去重"""
+    dedup_cfg = config.get('dedup') or {}
+    if not dedup_cfg.get('enabled', True):
+        return None
+    return DedupIndex(
+        config.get('paths', {}).get('dedup_file') or script_dir / "dedup_index.jsonl",
+        hash_workers=int(dedup_cfg.get('hash_workers', DEFAULT_HASH_WORKERS)),
+    )
+
+def create_tuner(config, script_dir):
+    """按配置创建并发数自适应调节器；upload.auto_limit.enabled=false 时固定使用 upload.limit"""
+    upload_cfg = config.get('upload') or {}
+    auto_cfg = upload_cfg.get('auto_limit') or {}
+    if not auto_cfg.get('enabled', True):
+        return None
+    return ConcurrencyTuner(
+        config.get('paths', {}).get('tuning_file') or script_dir / "upload_tuning.json",
+        min_limit=auto_cfg.get('min', DEFAULT_AUTO_LIMIT_MIN),
+        max_limit=auto_cfg.get('max', DEFAULT_AUTO_LIMIT_MAX),
+        initial_limit=upload_cfg.get('limit', DEFAULT_UPLOAD_LIMIT),
+    )
+
+def create_line_selector(config, script_dir):
+    """按配置创建上传线路选择器；line_probe.enabled 为 false（默认）时使用 stream_gears 的默认线路"""
+    probe_cfg = config.get('line_probe') or {}
+    if not probe_cfg.get('enabled', False):
+        return None
+    return LineSelector(config.get('paths', {}).get('line_probe_file') or script_dir / "line_probe.json", probe_cfg)
+
+def upload_videos(video_paths, config, script_dir, cookie_file, journal, budget, tuner=None, dedup=None,
+                  metrics=None, cleaner=None, lines=None):
+    """剔除已投稿的分段与重复内容后按会话分组并行上传，返回 (会话数, 成功数)
+
+    上传成功后的删除在 cleaner 中后台进行；未传入时使用自己的清理线程，返回前等待删除完成。
+    """
+    behavior_cfg = config.get('behavior', {})
+    upload_cfg = config.get('upload') or {}
+
+    video_paths = skip_uploaded_parts(video_paths, journal, behavior_cfg)
+    if not video_paths:
+        logging.info("所有视频均已上传，无需再次上传。")
+        return 0, 0
+    if dedup:
+        video_paths = skip_duplicate_parts(video_paths, dedup, behavior_cfg)
+        if not video_paths:
+            logging.info("所有视频均与已上传内容重复，无需再次上传。")
+            return 0, 0
+
+    # 按 '标题_日期_序号' 分组为独立投稿，互不相关的会话并行上传
+    sessions = plan_sessions(video_paths)
+    max_parallel = max(1, int(upload_cfg.get('max_parallel_sessions', DEFAULT_MAX_PARALLEL_SESSIONS)))
+
+    def run_session(session):
+        try:
+            return upload_session(session, config, script_dir, cookie_file, journal, budget, tuner, dedup,
+                                  metrics, cleaner or own_cleaner, lines)
+        except Exception as e:
+            logging.error(f"[{session['name']}] 发生未知错误: {e}")
+            return False
+
+    own_cleaner = None if cleaner else ThreadPoolExecutor(max_workers=1, thread_name_prefix='cleanup')
+    try:
+        with ThreadPoolExecutor(max_workers=min(max_parallel, len(sessions)), thread_name_prefix='upload') as pool:
+            results = list(pool.map(bind_streamer(run_session), sessions))
+    finally:
+        if own_cleaner:
+            own_cleaner.shutdown(wait=True)
+
+    succeeded = sum(results)
+    logging.info(f"本次共 {len(sessions)} 个投稿会话，成功 {succeeded} 个，失败 {len(sessions) - succeeded} 个。")
+    return len(sessions), succeeded
+
+def on_segment_finished(path, validate_cfg=None):
+    """分段写完后立即执行的准备工作，返回该分段是否可以上传"""
+    validate_cfg = validate_cfg or {}
+    try:
+        size_mb = path.stat().st_size / 1024 / 1024
+    except OSError:
+        return False
+    logging.info(f"[监视] 分段已写完: {path.name} ({size_mb:.1f} MB)")
+    if path.suffix.lower() != '.ts' or not validate_cfg.get('enabled', True):
+        return True
+    # 分段刚关闭时就检查完整性并裁掉被截断的尾包，不占用直播结束后的时间
+    try:
+        result = check_segment(path, bool(validate_cfg.get('trim_tail', True)),
+                               float(validate_cfg.get('max_bad_ratio', DEFAULT_MAX_BAD_RATIO)))
+    except (OSError, ValueError) as e:
+        logging.error(f"[监视] 检查分段 {path.name} 失败: {e}")
+        return False
+    if not result['ok']:
+        logging.error(f"[监视] 分段 {path.name} 未通过完整性检查，将不会上传: {result['reason']}")
+    elif result['trimmed']:
+        logging.warning(f"[监视] 分段 {path.name} 末尾被截断，已裁掉 {result['trimmed']} 字节。")
+    return result['ok']
+
+# --- 主程序 ---
+
+def get_script_dir():
+    """确定根目录 (兼容PyInstaller)"""
+    if getattr(sys, 'frozen', False):
+        # 如果是打包后的 .exe 文件，根目录是 .exe 文件所在的目录
+        return Path(sys.executable).parent
+    # 如果是普通的 .py 脚本，根目录是脚本文件所在的目录
+    return Path(__file__).resolve().parent
+
+def create_shared_resources(config, script_dir):
+    """创建可在多次上传（多个主播）之间共用的资源。
+
+    全局连接预算、断点续传日志簿、并发调节器、线路选择器、去重索引与目录索引在同一进程中
+    只应各有一份，否则连接上限无法全局生效，多个实例同时写同一文件也会互相覆盖。
+    """
+    paths_cfg = config.get('paths', {})
+    upload_cfg = config.get('upload') or {}
+    return {
+        'budget': ConnectionBudget(upload_cfg.get('max_connections', DEFAULT_MAX_CONNECTIONS)),
+        'journal': UploadJournal(paths_cfg.get('journal_file') or script_dir / "upload_journal.jsonl"),
+        'tuner': create_tuner(config, script_dir),
+        'lines': create_line_selector(config, script_dir),
+        'dedup': create_dedup_index(config, script_dir),
+        'index': DirectoryIndex(paths_cfg.get('scan_snapshot') or script_dir / "scan_index.json"),
+    }
+
+def upload_pipeline(config, script_dir, shared=None, metrics=None):
+    """扫描、去重、分组上传并按需重启录制软件，返回退出码 (0 成功或无需上传, 1 失败)
+
+    shared 为 create_shared_resources 创建的共用资源；由调用方提供时，
+    带宽调度也由调用方负责。metrics 为记录各阶段耗时的 RunMetrics。
+    """
+    metrics = metrics or RunMetrics()
+    paths_cfg = config.get('paths', {})
+    own_resources = shared is None
+    shared = shared or create_shared_resources(config, script_dir)
+
+    # 3. 获取并排序视频文件
+    with metrics.stage('scan'):
+        video_paths = get_sorted_videos(Path(paths_cfg['video_folder']), config.get('validate'), shared['index'])
+    if not video_paths:
+        return 0
+
+    cookie_file = Path(paths_cfg['cookies_file'])
+    if not cookie_file.exists():
+        logging.error(f"错误: Cookies 文件未找到 -> {cookie_file}")
+        return 1
+    # 凭据临近到期时先续期；已失效则不上传，免得每个会话都在重试中耗尽
+    if not get_credential_service(cookie_file, config.get('login')).ensure_fresh():
+        logging.error("登录凭据已失效，本次不上传，请重新扫码登录后再运行。")
+        return 1
+
+    # 4. 分组上传（已投稿成功的分段会被跳过）
+    budget = shared['budget']
+    bandwidth = None
+    if own_resources:
+        bandwidth = BandwidthScheduler(budget, config.get('bandwidth') or {}, paths_cfg['video_folder'])
+        bandwidth.start()
+    # 已上传文件的删除在后台进行，与后续会话的上传及录制软件的重启同时进行，退出前等待完成
+    cleaner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cleanup')
     try:
-        logging.info(f"开始上传，标题: '{final_title}'")
-        result_json = stream_gears.upload_by_app(
-            video_path=video_paths,
-            cookie_file=cookie_file,
-            title=video_info["title"],
-            tid=video_info["tid"],
-            tag=video_info["tag"],
-            copyright=video_info["copyright"],
-            source=video_info["source"],
-            desc=video_info["desc"],
-            cover=video_info["cover"],
-            limit=video_info["limit"],
-            extra_fields=video_info["extra-fields"]
-        )
-        logging.info(f"服务器返回: {result_json}")
-        
-        # 6. 处理结果
-        process_upload_result(result_json, video_paths, cover_path, behavior_cfg)
-
-        # 检查并重启录制软件
-        recorder_cfg = config.get('recorder', {})
-        recorder_process_name = recorder_cfg.get('process_name')
-        recorder_exe_path = paths_cfg.get('recorder_exe_path')
-
-        if not recorder_process_name or not recorder_exe_path:
-            logging.info("配置文件中未提供 'recorder' 设置或 'recorder_exe_path'，跳过重启录制软件的步骤。")
+        try:
+            total, succeeded = upload_videos(video_paths, config, script_dir, cookie_file, shared['journal'],
+                                             budget, shared['tuner'], shared['dedup'], metrics, cleaner,
+                                             shared['lines'])
+        finally:
+            if bandwidth:
+                bandwidth.stop()
+        if not total:
+            return 0
+
+        try:
+            recording = recording_streamer_folders(config)
+            if succeeded and recording:
+                logging.info(f"仍有主播在录制 ({', '.join(recording)})，本次不重启录制软件，留到之后的上传。")
+            elif succeeded:
+                with metrics.stage('restart'):
+                    restart_recorder(config)
+        except Exception as e:
+            logging.error(f"发生未知错误: {e}")
+            return 1
+    finally:
+        cleaner.shutdown(wait=True)
+
+    return 0 if succeeded == total else 1
+
+def run(config=None, shared=None):
+    """在当前进程中执行一次完整的上传流程，返回退出码。
+
+    供 ts.py 直接调用，不必再启动单独的 up.exe。传入 config 时沿用调用方
+    已加载的配置，传入 shared 时使用调用方的共用资源；日志系统已由调用方
+    初始化时，额外把本次日志写入 paths.log_file，与单独运行 up.exe 时一致。
+    """
+    script_dir = get_script_dir()
+    if config is None:
+        config = load_config(script_dir / "config.yaml")
+    elif not check_config(config):
+        logging.error("配置文件缺少上传所需的路径设置，无法执行上传。")
+        return 1
+    if not config:
+        return 1
+
+    # 日志按主播标记，多个主播同时上传时 paths.log_file 只写入本主播的记录
+    streamer = current_streamer() or config['paths'].get('name') or 'upload'
+    with streamer_context(streamer):
+        log_file_path = Path(config['paths']['log_file'])
+        log_handler = None
+        if logging.getLogger().handlers:
+            log_handler = create_file_handler(log_file_path, config.get('logging'))
+            log_handler.addFilter(StreamerFilter(streamer))
+            add_handler(log_handler)
+            logging.info(f"上传日志将同时记录到: {log_file_path}")
         else:
-            # 预先等待 5 秒再检查（有些录制程序还在写入/退出）
-            logging.info("等待 5 秒后再检查录制软件进程状态...")
-            time.sleep(5)
-            # 检查进程是否在运行
-            if any(p.name() == recorder_process_name for p in psutil.process_iter()):
-                logging.info(f"检测到 {recorder_process_name} 正在运行，现在关闭它...")
-                os.system(f'taskkill /f /im {recorder_process_name}')
-                time.sleep(10)  # 等待进程完全关闭
-                logging.info(f"{recorder_process_name} 已关闭。")
-            else:
-                logging.info(f"未检测到 {recorder_process_name} 运行。")
-
-            # 尝试重启
-            if Path(recorder_exe_path).exists():
-                subprocess.Popen(['start', '', recorder_exe_path], shell=True)
-                logging.info(f"{recorder_process_name} 已从路径 '{recorder_exe_path}' 重启。")
-            else:
-                logging.error(f"配置文件中指定的路径不存在: '{recorder_exe_path}'，无法重启。")
-
-    except RuntimeError as e:
-        logging.error(f"上传过程中发生严重错误: {e}")
+            setup_logging(log_file_path, config.get('logging'))
+        logging.info(f"脚本所在目录: {script_dir}")
+
+        metrics = RunMetrics(config['paths'].get('name'))
+        exit_code = None
+        try:
+            exit_code = upload_pipeline(config, script_dir, shared, metrics)
+            return exit_code
+        finally:
+            logging.info(f"各阶段耗时: {metrics.summary() or '无'}")
+            if (config.get('metrics') or {}).get('enabled', True):
+                metrics.save(config['paths'].get('metrics_file') or script_dir / "metrics.jsonl", exit_code)
+            if log_handler:
+                remove_handler(log_handler)
+
+def main():
+    sys.exit(run())
+
+def watch():
+    """监视模式：常驻运行，分段写完即处理，直播结束后立即投稿，不必等到定时任务"""
+    script_dir = get_script_dir()
+    config = load_config(script_dir / "config.yaml")
+    if not config:
         sys.exit(1)
-    except Exception as e:
-        logging.error(f"发生未知错误: {e}")
+
+    paths_cfg = config.get('paths', {})
+    upload_cfg = config.get('upload') or {}
+    watch_cfg = config.get('watch') or {}
+
+    setup_logging(Path(paths_cfg['log_file']), config.get('logging'))
+    logging.info(f"脚本所在目录: {script_dir}")
+
+    cookie_file = Path(paths_cfg['cookies_file'])
+    if not cookie_file.exists():
+        logging.error(f"错误: Cookies 文件未找到 -> {cookie_file}")
         sys.exit(1)
 
+    # 常驻期间在凭据到期前自动续期
+    get_credential_service(cookie_file, config.get('login')).start()
+
+    journal = UploadJournal(paths_cfg.get('journal_file') or script_dir / "upload_journal.jsonl")
+    budget = ConnectionBudget(upload_cfg.get('max_connections', DEFAULT_MAX_CONNECTIONS))
+    tuner = create_tuner(config, script_dir)
+    dedup = create_dedup_index(config, script_dir)
+    lines = create_line_selector(config, script_dir)
+    bandwidth = BandwidthScheduler(budget, config.get('bandwidth') or {}, paths_cfg['video_folder'])
+    bandwidth.start()
+    poll_interval = float(watch_cfg.get('poll_interval', DEFAULT_WATCH_POLL_INTERVAL))
+    watcher = SegmentWatcher(
+        paths_cfg['video_folder'],
+        settle_seconds=float(watch_cfg.get('segment_settle_seconds', DEFAULT_SEGMENT_SETTLE_SECONDS)),
+        stream_end_seconds=float(watch_cfg.get('stream_end_seconds', DEFAULT_STREAM_END_SECONDS)),
+    )
+    # 监视模式下录制软件可能正在录其他直播，默认不重启
+    restart = bool(watch_cfg.get('restart_recorder', False))
+    max_parallel = max(1, int(upload_cfg.get('max_parallel_sessions', DEFAULT_MAX_PARALLEL_SESSIONS)))
+
+    rejected = set()
+    retry_backoff = float(watch_cfg.get('retry_backoff', DEFAULT_WATCH_RETRY_BACKOFF))
+    failures = {}
+
+    def finalize(name, parts):
+        parts = [p for p in parts if p not in rejected]
+        if not parts:
+            logging.warning(f"[监视] 直播 {name} 没有可上传的分段。")
+            return
+        logging.info(f"[监视] 直播 {name} 已结束，开始投稿 {len(parts)} 个分段")
+        try:
+            total, succeeded = upload_videos(parts, config, script_dir, cookie_file, journal, budget, tuner, dedup,
+                                             lines=lines)
+        except Exception as e:
+            logging.exception(f"[监视] 直播 {name} 投稿异常: {e}")
+            total, succeeded = 1, 0
+        if succeeded < total:
+            # 分段不会再变化，不主动重新排队的话直到进程重启都不会再投稿
+            delay = min(retry_backoff * 2 ** failures.get(name, 0), MAX_WATCH_RETRY_BACKOFF)
+            failures[name] = failures.get(name, 0) + 1
+            watcher.retry_later(name, delay)
+            logging.warning(f"[监视] 直播 {name} 有投稿失败，{delay:.0f} 秒后重新投稿（第 {failures[name]} 次）。")
+        else:
+            failures.pop(name, None)
+        if succeeded and restart:
+            restart_recorder(config)
+
+    logging.info(f"[监视] 开始监视 {paths_cfg['video_folder']}，每 {poll_interval:.0f} 秒检查一次")
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix='stream') as pool:
+        while True:
+            finished, ended = watcher.poll()
+            for path in finished:
+                if not on_segment_finished(path, config.get('validate')):
+                    rejected.add(path)
+            for name, parts in ended.items():
+                pool.submit(finalize, name, parts)
+            time.sleep(poll_interval)
+
 if __name__ == '__main__':
-    main()
+    # 打包为 exe 后，完整性检查使用的进程池需要此调用
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description='up.py 上传脚本')
+    parser.add_argument('--watch', action='store_true', help='常驻监视录制目录, 直播结束后立即上传')
+    args = parser.parse_args()
+    if args.watch:
+        watch()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,100 @@
+from pathlib import Path
+import logging
+import os
+import threading
+import time
+
+from planner import parse_video_name
+
+VIDEO_SUFFIXES = ('.ts', '.mp4', '.flv')
+
+
+class SegmentWatcher:
+    """轮询录制目录，判断哪些分段已写完、哪场直播已经结束。
+
+    分段视为已完成的条件（满足其一）:
+      - 文件大小与修改时间在 settle_seconds 内没有变化
+      - 录制软件已开始写同一场直播的下一个 _NNN 分段
+    一场直播视为已结束: 其所有分段均已完成，且最后一个分段已静止
+    stream_end_seconds 秒（录制中最新分段会持续增长）。
+    投稿失败时调用 retry_later()，到时间后若该直播仍在目录中，会再次作为已结束的直播返回。
+    """
+
+    def __init__(self, video_folder, settle_seconds=30, stream_end_seconds=180):
+        self.video_folder = Path(video_folder)
+        self.settle_seconds = settle_seconds
+        self.stream_end_seconds = stream_end_seconds
+        # 文件名 -> {'size', 'mtime', 'changed', 'finished'}
+        self.files = {}
+        self.ended = set()
+        # 会话名 -> 允许再次触发的时刻（monotonic）；retry_later 可在其他线程调用
+        self._retry_at = {}
+        self._lock = threading.Lock()
+
+    def retry_later(self, key, delay):
+        """delay 秒后允许该直播再次被判为已结束（投稿失败后重试）"""
+        with self._lock:
+            self._retry_at[key] = time.monotonic() + delay
+
+    def poll(self):
+        """扫描一次目录，返回 (本次新完成的分段列表, 本次结束的直播 {会话名: [分段...]})"""
+        now = time.monotonic()
+        seen = {}
+        try:
+            with os.scandir(self.video_folder) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.lower().endswith(VIDEO_SUFFIXES):
+                        st = entry.stat()
+                        seen[entry.name] = (st.st_size, st.st_mtime_ns)
+        except OSError as e:
+            logging.error(f"扫描录制目录失败: {e}")
+            return [], {}
+
+        with self._lock:
+            for key, due in list(self._retry_at.items()):
+                if now >= due:
+                    del self._retry_at[key]
+                    self.ended.discard(key)
+
+        for name in list(self.files):
+            if name not in seen:
+                # 已被上传后删除或被移走
+                del self.files[name]
+        for name, (size, mtime) in seen.items():
+            state = self.files.get(name)
+            if state is None or (state['size'], state['mtime']) != (size, mtime):
+                self.files[name] = {'size': size, 'mtime': mtime, 'changed': now,
+                                    'finished': state['finished'] if state else False}
+
+        sessions = {}
+        for name in self.files:
+            parsed = parse_video_name(name)
+            key = '_'.join(p for p in parsed[:3] if p) if parsed else name
+            sessions.setdefault(key, []).append((parsed[3] if parsed else 0, name))
+
+        newly_finished, ended = [], {}
+        for key, parts in sessions.items():
+            parts.sort()
+            last_index = parts[-1][0]
+            for index, name in parts:
+                state = self.files[name]
+                if state['finished']:
+                    continue
+                if index < last_index or now - state['changed'] >= self.settle_seconds:
+                    state['finished'] = True
+                    newly_finished.append(self.video_folder / name)
+
+            latest = self.files[parts[-1][1]]
+            if (key not in self.ended
+                    and all(self.files[name]['finished'] for _, name in parts)
+                    and now - latest['changed'] >= self.stream_end_seconds):
+                self.ended.add(key)
+                ended[key] = [self.video_folder / name for _, name in parts]
+
+        # 直播结束后又出现新分段（同名会话继续录制），允许再次触发
+        self.ended.intersection_update(sessions)
+        for key in list(self.ended):
+            latest = self.files[sorted(sessions[key])[-1][1]]
+            if now - latest['changed'] < self.stream_end_seconds:
+                self.ended.discard(key)
+        return newly_finished, ended